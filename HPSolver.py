@@ -15,6 +15,8 @@ DM any bugs or suggestions, a forum post for the
 app can be found on EUT discord (.gg/eut).
 """
 
+import time
+STARTUP_T0 = time.perf_counter()
 import customtkinter as ctk
 import keyboard
 import sys
@@ -22,31 +24,25 @@ import os
 import platform
 import subprocess
 from PIL import Image
-import mss
 import numpy as np
 import cv2
 import pytesseract
-import time
 import tkinter as tk
 import threading
-from char_predictor import predict_char
-import csv
+from recognition import (load_templates, recognize_cells_cached, start_pool,
+                         glyph_cache, cell_cache, cascade, index_report,
+                         RECOGNITION_WORKERS)
+import char_predictor
+from debug_sink import sink as debug
+from tile_detect import detect_tiles, warp_grid
+from color_mask import color_classifier, to_bgr
+from capture import open_capture
 import socket
 
 # Platform detection
 IS_WINDOWS = platform.system() == "Windows"
 IS_LINUX = platform.system() == "Linux"
 
-# Directories and valid chars
-UNKNOWN_DIR    = "unknown_chars"
-ALL_CHARS_DIR  = "all_chars"
-LABEL_FILE = "char_labels.csv"
-VALID_CHARS    = "0123456789!@#$%^&*()"
-
-# Ensure directories exist
-for d in (UNKNOWN_DIR, ALL_CHARS_DIR):
-    os.makedirs(d, exist_ok=True)
-
 # Detect display server on Linux
 IS_WAYLAND = False
 IS_X11 = False
@@ -108,6 +104,12 @@ except:
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
 
+# Recognition pool before any window or thread exists: in "processes"
+# mode the workers are forked here, and a fork only copies the calling
+# thread, so forking later (Tk, keyboard hook, Wayland socket and loader
+# threads running) could leave a worker holding one of their locks.
+start_pool()
+
 app = ctk.CTk()
 app.geometry("463x385")
 app.resizable(False, False)
@@ -1115,72 +1117,128 @@ IS_LINUX   = platform.system() == "Linux"
 IS_WAYLAND = IS_LINUX and bool(os.environ.get("WAYLAND_DISPLAY"))
 IS_X11     = IS_LINUX and not IS_WAYLAND
 
-DEBUG_DIR = os.path.join(os.path.abspath("."), "debug")
-
-def _prep_debug_dir():
-    if os.path.isdir(DEBUG_DIR):
-        for f in os.listdir(DEBUG_DIR):
-            try: os.remove(os.path.join(DEBUG_DIR, f))
-            except: pass
-    else:
-        os.makedirs(DEBUG_DIR)
-
-def grab_full_screen():
-    """Cross-platform full-screen grab:
-       - Wayland: uses `grim -` (install grim)
-       - X11/Windows: uses mss"""
-    toplevels = {
-      "order":    order_window,
-      "settings": settings_window,
-      "info":     info_window
-    }
-    visible = {}
-    for name, w in toplevels.items():
-        visible[name] = bool(w and w.winfo_exists() and w.state()!="withdrawn")
-        if visible[name]:
+# Where the last scan found the grid, in screen coordinates; scans grab
+# only this rectangle (grown by SCAN_ROI_MARGIN tiles on each side) until
+# the grid is not found in it.
+SCAN_ROI_MARGIN = 0.5
+scan_roi = None              # {"left", "top", "width", "height"} or None
+screen_rect = None           # the full-screen grab's rectangle, for clipping
+
+# Captures leave our windows up and black out their rectangles instead of
+# withdrawing them, waiting for a redraw and bringing them back (flicker
+# and ~50 ms per grab). On Wayland, Tk's window coordinates (XWayland)
+# need not match grim's layout, so windows are still hidden there.
+CAPTURE_HIDE_WINDOWS = IS_WAYLAND
+# one backend for the session (HPSOLVER_CAPTURE picks another, e.g.
+# "replay:shots/" to run scans on recorded screenshots)
+capturer = open_capture()
+
+def _shown_windows():
+    wins = [app, order_window, settings_window, info_window, console.window]
+    return [w for w in wins if w is not None and w.winfo_exists()
+            and w.state() not in ("withdrawn", "iconic")]
+
+def _black_out_windows(img, origin, windows):
+    """Zero our windows' pixels in img; True if any of them was in it."""
+    h, w = img.shape[:2]
+    covered = False
+    for win in windows:
+        x0 = max(win.winfo_rootx() - origin[0], 0)
+        y0 = max(win.winfo_rooty() - origin[1], 0)
+        x1 = min(win.winfo_rootx() + win.winfo_width() - origin[0], w)
+        y1 = min(win.winfo_rooty() + win.winfo_height() - origin[1], h)
+        if x0 < x1 and y0 < y1:
+            img[y0:y1, x0:x1] = 0
+            covered = True
+    return covered
+
+def grab_screen(region=None, hide=None):
+    """Screen grab of `region` (mss-style dict) or of everything when
+       None, through `capturer` (capture.py: mss, grim or replay).
+       Our windows are withdrawn first if hide (default
+       CAPTURE_HIDE_WINDOWS), otherwise blacked out of the image.
+       Returns (image or None, (left, top) of its first pixel, whether
+       our windows covered part of it); the image is BGRA straight from
+       mss, BGR from grim and replay."""
+    global screen_rect
+    if hide is None:
+        hide = CAPTURE_HIDE_WINDOWS
+    # replayed frames are not the screen our windows are on
+    shown = _shown_windows() if capturer.live else []
+    if hide and shown:
+        for w in shown:
             w.withdraw()
-    app.withdraw(); app.update(); time.sleep(0.05)
+        app.update(); time.sleep(0.05)
 
+    t0 = time.perf_counter()
     target = None
+    origin = (region["left"], region["top"]) if region else (0, 0)
+    try:
+        # mss: BGRA view over the grab's own buffer, no copy; grim: raw
+        # PPM, no PNG round trip. Everything downstream takes either.
+        target, origin = capturer.grab(region)
+        if region is None:
+            screen_rect = capturer.screen()
+    except Exception as e:
+        print(f"{capturer.name} grab failed:", e)
+    grab_ms = (time.perf_counter() - t0) * 1000
 
-    if IS_WAYLAND:
-        try:
-            p = subprocess.run(["grim", "-"], capture_output=True, check=True)
-            arr = np.frombuffer(p.stdout, dtype=np.uint8)
-            target = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        except Exception as e:
-            print("Wayland grab failed (need grim?):", e)
-    else:
-        try:
-            with mss.mss() as sct:
-                mon = sct.monitors[0]
-                shot = sct.grab(mon)            # BGRA
-            target = np.array(shot)[:, :, :3]    # drop alpha → BGR
-        except Exception as e:
-            print("mss grab failed:", e)
-    
-    if target is not None:
-        cv2.imwrite(os.path.join(DEBUG_DIR, "00_screenshot.png"), target)
-
-    app.deiconify()
-    for name, w in toplevels.items():
-        if visible[name]:
+    covered = False
+    if hide:
+        for w in shown:
             w.deiconify()
+    elif target is not None:
+        covered = _black_out_windows(target, origin, shown)
 
-    return target
-
-def scan_puzzle_grid():
-    _prep_debug_dir()
-
-    # 2) grab screen
-    img = grab_full_screen()
+    if target is not None:
+        print(f"Capture ({capturer.name}): {target.shape[1]}x{target.shape[0]} "
+              f"in {grab_ms:.0f} ms"
+              + (", our windows blacked out" if covered else ""))
+        if debug.enabled():
+            debug.save("00_screenshot.png", to_bgr(target))
+
+    return target, origin, covered
+
+def _grid_roi(tiles, origin):
+    """Screen rectangle around the 25 tiles plus SCAN_ROI_MARGIN tiles."""
+    x0 = min(t[1] for t in tiles); y0 = min(t[2] for t in tiles)
+    x1 = max(t[1] + t[3] for t in tiles); y1 = max(t[2] + t[4] for t in tiles)
+    pad = int(SCAN_ROI_MARGIN * max(max(t[3], t[4]) for t in tiles))
+    left, top = origin[0] + x0 - pad, origin[1] + y0 - pad
+    right, bottom = origin[0] + x1 + pad, origin[1] + y1 + pad
+    if screen_rect:
+        left = max(left, screen_rect["left"])
+        top = max(top, screen_rect["top"])
+        right = min(right, screen_rect["left"] + screen_rect["width"])
+        bottom = min(bottom, screen_rect["top"] + screen_rect["height"])
+    return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+def scan_puzzle_grid(hide=None):
+    debug.new_scan("grid")
+
+    # 2) grab screen: the last grid's region if we know it
+    roi = scan_roi if capturer.regions else None
+    img, origin, covered = grab_screen(roi, hide)
+    if img is None and roi is not None:
+        print("ROI grab failed, grabbing the full screen")
+        _forget_scan_roi()
+        img, origin, covered = grab_screen(hide=hide)
 
     if img is None:
         print("Scan aborted: could not capture screen")
         return
 
+    # 3) progress bar, filled as cells come in
+    scan_progress.set(0)
+    scan_progress.grid(row=6, column=0, columnspan=5, pady=(4, 0), sticky="ew")
+
     # 4) spawn a background thread to do the heavy lifting
-    threading.Thread(target=_process_scan, args=(img,), daemon=True).start()
+    threading.Thread(target=_process_scan, args=(img, origin, roi is not None, covered),
+                     daemon=True).start()
+
+def _forget_scan_roi():
+    global scan_roi
+    scan_roi = None
 
 def perspective_correct_and_extract_cells(img, tiles, debug_dir, cell_size=100):
     grid_size = cell_size * 5
@@ -1205,16 +1263,18 @@ def perspective_correct_and_extract_cells(img, tiles, debug_dir, cell_size=100):
     ], dtype=np.float32)
 
     # Draw debug overlay on original image
-    debug_img = img.copy()
-    for pt in pts_src:
-        cv2.circle(debug_img, tuple(np.int32(pt)), 10, (0,0,255), -1)
-    cv2.polylines(debug_img, [np.int32(pts_src)], isClosed=True, color=(0,255,0), thickness=3)
-    cv2.imwrite(os.path.join(debug_dir, "49_grid_corners.png"), debug_img)
+    if debug_dir:
+        debug_img = to_bgr(img, copy=True)
+        for pt in pts_src:
+            cv2.circle(debug_img, tuple(np.int32(pt)), 10, (0,0,255), -1)
+        cv2.polylines(debug_img, [np.int32(pts_src)], isClosed=True, color=(0,255,0), thickness=3)
+        debug.imwrite(os.path.join(debug_dir, "49_grid_corners.png"), debug_img)
 
     # Compute and apply perspective transform
     M = cv2.getPerspectiveTransform(pts_src, pts_dst)
-    warped = cv2.warpPerspective(img, M, (grid_size, grid_size))
-    cv2.imwrite(os.path.join(debug_dir, "50_grid_warped.png"), warped)
+    warped = to_bgr(cv2.warpPerspective(img, M, (grid_size, grid_size)))
+    if debug_dir:
+        debug.imwrite(os.path.join(debug_dir, "50_grid_warped.png"), warped)
 
     # Extract each cell
     cells = []
@@ -1225,542 +1285,140 @@ def perspective_correct_and_extract_cells(img, tiles, debug_dir, cell_size=100):
             y0 = i * cell_size
             cell_img = warped[y0:y0+cell_size, x0:x0+cell_size]
             row.append(cell_img)
-            cv2.imwrite(os.path.join(debug_dir, f"51_cell_{i}_{j}.png"), cell_img)
+            if debug_dir:
+                debug.imwrite(os.path.join(debug_dir, f"51_cell_{i}_{j}.png"), cell_img)
         cells.append(row)
     return cells
 
-def load_templates():
-    templates = {}  # label -> list of images
-    with open(LABEL_FILE) as f:
-        reader = csv.reader(f)
-        for fname, label in reader:
-            img_path = os.path.join(ALL_CHARS_DIR, fname)
-            if not os.path.exists(img_path):
-                continue
-            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-            _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            if np.mean(img) > 127:
-                img = 255 - img
-            templates.setdefault(label, []).append(img)
-    return templates
-
-def count_holes(bin_img):
-    cnts, hier = cv2.findContours(
-        bin_img, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
-    )
-    if hier is None:
-        return 0
-    hole_count = 0
-    for h in hier[0]:
-        # h[3] != -1 → this contour has a parent → it's a hole
-        if h[3] != -1:
-            hole_count += 1
-    return hole_count
-
-def count_blobs(bin_img):
-    # bin_img: single-channel, 0/255, foreground=255
-    cnts, _ = cv2.findContours(bin_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    return len(cnts)
-
-def match_template_ncc_improved(
-    char_bin,
-    templates,  # label -> list of images
-    ncc_thresh=0.65,
-    fill_penalty_w=0.5,
-    hole_penalty_w=0.7
-):
-    """
-    Returns (best_label, best_score) or (None, score) if below ncc_thresh.
-    Penalizes:
-      - Non-negative fills: live=fg where tmpl=bg
-      - Hole-count mismatches
-    Uses all labeled images as templates.
-    """
-    if not templates:
-        return None, None
-
-    # blob_count = count_blobs(char_bin)
-    # if blob_count == 2:
-    #     return "!", 1.0
-    # elif blob_count == 3:
-    #     return "%", 1.0
-
-    holes_char = count_holes(char_bin)
-    best_label = None
-    best_score = -1.0
-
-    for label, tmpl_list in templates.items():
-        for tmpl in tmpl_list:
-            tmpl_rs = cv2.resize(tmpl, (char_bin.shape[1], char_bin.shape[0]), interpolation=cv2.INTER_AREA)
-            _, tmpl_bin = cv2.threshold(tmpl_rs, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            if np.mean(tmpl_bin) > 127:
-                tmpl_bin = 255 - tmpl_bin
-
-            res = cv2.matchTemplate(
-                char_bin.astype(np.float32),
-                tmpl_bin.astype(np.float32),
-                cv2.TM_CCOEFF_NORMED
-            )
-            ncc_score = float(res[0,0])
-
-            nonneg = np.logical_and(tmpl_bin == 0, char_bin == 255)
-            fill_penalty = fill_penalty_w * (np.sum(nonneg) / nonneg.size)
-
-            holes_tmpl = count_holes(tmpl_bin)
-            hole_diff = abs(holes_char - holes_tmpl)
-            hole_penalty = hole_penalty_w * hole_diff / max(holes_tmpl, 1)
-
-            score = ncc_score - fill_penalty - hole_penalty
-            if score > best_score:
-                best_score = score
-                best_label = label
-
-    if best_score < ncc_thresh:
-        return None, best_score
-    return best_label, best_score
-
-def save_new_template(char_img, label, templates):
-    fname = os.path.join(TEMPLATE_DIR, f"{label}.png")
-    if not os.path.exists(fname):
-        if len(char_img.shape) == 3:
-            gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = char_img.copy()
-        _, bin_img = cv2.threshold(gray, 0, 255,
-                                   cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        if np.mean(bin_img) > 127:
-            bin_img = 255 - bin_img
-        cv2.imwrite(fname, bin_img)
-        print(f"Saved new template: {fname}")
-        templates[label] = bin_img
-
-def save_unknown(char_img, i, j, idx):
-    fname = os.path.join(UNKNOWN_DIR, f"char_{i}_{j}_{idx}.png")
-    if len(char_img.shape) == 3:
-        gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = char_img.copy()
-    _, bin_img = cv2.threshold(gray, 0, 255,
-                               cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    if np.mean(bin_img) > 127:
-        bin_img = 255 - bin_img
-    cv2.imwrite(fname, bin_img)
-    print(f"Saved unknown character: {fname}")
-
-def save_all_char(char_img, i, j, idx, label):
-    fname = os.path.join(ALL_CHARS_DIR,
-                         f"char_{i}_{j}_{idx}_{label}.png")
-    if len(char_img.shape) == 3:
-        gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = char_img.copy()
-    _, bin_img = cv2.threshold(gray, 0, 255,
-                               cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    if np.mean(bin_img) > 127:
-        bin_img = 255 - bin_img
-    cv2.imwrite(fname, bin_img)
-
-def merge_boxes(pads, x_thresh=10, y_thresh=12):
-    """
-    Merge boxes that are close in x and y.
-    pads: list of (x0, x1, y0, y1)
-    Returns: list of merged boxes
-    """
-    merged = []
-    used = [False] * len(pads)
-    for i, (x0, x1, y0, y1) in enumerate(pads):
-        if used[i]:
-            continue
-        group = [(x0, x1, y0, y1)]
-        used[i] = True
-        for j, (xx0, xx1, yy0, yy1) in enumerate(pads):
-            if i == j or used[j]:
-                continue
-            # If horizontally aligned and close vertically, or vice versa
-            x_overlap = min(x1, xx1) - max(x0, xx0)
-            x_close = x_overlap > -x_thresh  # allow a little gap
-            y_gap = min(abs(y1 - yy0), abs(yy1 - y0))
-            y_close = y_gap < y_thresh
-            if x_close and y_close:
-                group.append((xx0, xx1, yy0, yy1))
-                used[j] = True
-        gx0 = min(g[0] for g in group)
-        gx1 = max(g[1] for g in group)
-        gy0 = min(g[2] for g in group)
-        gy1 = max(g[3] for g in group)
-        merged.append((gx0, gx1, gy0, gy1))
-    return merged
-
-def filter_contained_boxes(boxes, epsilon=2):
-    """
-    Remove boxes that are fully contained within another box.
-    Keeps only the largest (outer) box in such cases.
-    """
-    keep = [True] * len(boxes)
-    for i, (x0, x1, y0, y1) in enumerate(boxes):
-        for j, (xx0, xx1, yy0, yy1) in enumerate(boxes):
-            if i == j:
-                continue
-            # If box i is fully inside box j
-            if (x0 >= xx0 - epsilon and x1 <= xx1 + epsilon and
-                y0 >= yy0 - epsilon and y1 <= yy1 + epsilon):
-                # If box j is strictly larger, mark i for removal
-                if (xx1-xx0)*(yy1-yy0) > (x1-x0)*(y1-y0):
-                    keep[i] = False
-                    break
-    return [box for k, box in zip(keep, boxes) if k]
-
-def group_into_lines(pads, chars, line_gap=0):
-    # Sort by y (top)
-    items = sorted(zip(pads, chars), key=lambda t: t[0][2])
-    lines = []
-    for pad, char in items:
-        x0, x1, y0, y1 = pad
-        placed = False
-        for line in lines:
-            # Get the max bottom of the current line
-            max_y1 = max(p[3] for p in line['pads'])
-            if y0 <= max_y1 + line_gap:
-                line['chars'].append(char)
-                line['pads'].append(pad)
-                placed = True
-                break
-        if not placed:
-            lines.append({'chars': [char], 'pads': [pad]})
-    return lines
-
-def segment_characters(cell_img, debug_prefix=None):
-    gray = cv2.cvtColor(cell_img, cv2.COLOR_BGR2GRAY)
-    _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    if np.mean(th) > 127:
-        th = 255 - th
-    if debug_prefix:
-        cv2.imwrite(f"{debug_prefix}_thresh.png", th)
-
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(th, connectivity=8)
-    pads = []
-    for i in range(1, num_labels):  # skip background
-        x, y, w, h, area = stats[i]
-        if area < 10:
-            continue
-        pads.append((x, x+w, y, y+h))
-
-    # --- Merge close blobs (tune x_thresh and y_thresh as needed) ---
-    # merged_pads = merge_boxes(pads, x_thresh=10, y_thresh=12)
-    merged_pads = pads
-
-    filtered_pads = filter_contained_boxes(merged_pads, epsilon=2)
-
-    chars_out, pads_out = [], []
-    for x0, x1, y0, y1 in filtered_pads:
-        chars_out.append(cell_img[y0:y1, x0:x1])
-        pads_out.append((x0, x1, y0, y1))
-
-    # --- Group into lines and sort left-to-right within each line ---
-    if len(chars_out) > 1:
-        lines = group_into_lines(pads_out, chars_out, line_gap=3)
-        chars_out, pads_out = [], []
-        for line in lines:
-            line_sorted = sorted(zip(line['pads'], line['chars']), key=lambda t: t[0][0])
-            for pad, char in line_sorted:
-                pads_out.append(pad)
-                chars_out.append(char)
-
-    if debug_prefix:
-        dbg = cv2.cvtColor(th, cv2.COLOR_GRAY2BGR)
-        for x0, x1, y0, y1 in pads_out:
-            cv2.rectangle(dbg, (x0, y0), (x1-1, y1-1), (0,255,0), 1)
-        cv2.imwrite(f"{debug_prefix}_split.png", dbg)
-
-    return chars_out, pads_out
-
-def unified_binarize_char(char_img,
-                          white_thresh=40,
-                          close_kernel=(1,1)):
-    """
-    Very simple “white‐text” binarizer:
-      - Any pixel where R,G,B are all ≥ white_thresh → foreground (255)
-      - Everything else → background (0)
-      - Tiny closing to join broken strokes.
+def _process_scan(img, origin=(0, 0), from_roi=False, covered=False):
+    global scan_roi
 
-    Returns a H×W uint8 mask (0=bg, 255=fg).
-    """
-    # split channels
-    b,g,r = cv2.split(char_img)
-    # mask white pixels
-    mask = ((b >= white_thresh) &
-            (g >= white_thresh) &
-            (r >= white_thresh)).astype(np.uint8) * 255
-
-    # tiny closing
-    kernel = cv2.getStructuringElement(
-        cv2.MORPH_RECT, close_kernel
-    )
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    return mask
-
-def cluster_pads_and_chars(pads, cell_img, overlap_thresh=0.3):
-    """
-    Merge any pads in the *one line* whose horizontal overlap
-    >= overlap_thresh×min(widths).  Return sorted-by-x0 lists
-    of new_pads and new_char_imgs.
-    """
-    if len(pads) <= 1:
-        # nothing to merge
-        chars = [ cell_img[y0:y1, x0:x1] for x0,x1,y0,y1 in pads ]
-        return pads, chars
-
-    # widths of each pad
-    widths = [(x1-x0) for x0,x1,y0,y1 in pads]
-    n = len(pads)
-    used = [False]*n
-    clusters = []
-
-    # build adjacency by horizontal overlap
-    for i in range(n):
-        if used[i]:
-            continue
-        used[i] = True
-        group = [i]
-        stack = [i]
-        while stack:
-            k = stack.pop()
-            x0k,x1k,y0k,y1k = pads[k]
-            wk = widths[k]
-            for j in range(n):
-                if used[j]:
-                    continue
-                x0j,x1j,y0j,y1j = pads[j]
-                wj = widths[j]
-                overlap = max(0, min(x1k, x1j) - max(x0k, x0j))
-                if overlap >= min(wk, wj)*overlap_thresh:
-                    used[j] = True
-                    stack.append(j)
-                    group.append(j)
-        clusters.append(group)
-
-    # now build merged pads & char crops
-    merged = []
-    for group in clusters:
-        x0 = min(pads[i][0] for i in group)
-        x1 = max(pads[i][1] for i in group)
-        y0 = min(pads[i][2] for i in group)
-        y1 = max(pads[i][3] for i in group)
-        merged.append((x0,x1,y0,y1))
-
-    # sort left→right
-    merged.sort(key=lambda p: p[0])
-
-    # extract char images
-    chars = [ cell_img[y0:y1, x0:x1] for x0,x1,y0,y1 in merged ]
-    return merged, chars
-
-def recognize_cell(cell_img,
-                   templates,
-                   nn_model=predict_char,
-                   debug_prefix=None):
-    """
-    1) raw CC segmentation → raw_chars, raw_pads
-    2) group_into_lines on raw_pads → lines0
-    3) for each line in lines0:
-         cluster_pads_and_chars(line['pads'], cell_img)
-       → collect merged_pads / merged_chars per line
-    4) per-glyph binarize+template/NN → labels
-    5) full debug dumps if debug_prefix≠None
-    6) if only one line → return that string
-       else → call parse_rgb_from_lines on the merged lines
-               and join non‐empty with spaces
-    """
-    # 1) segment
-    raw_chars, raw_pads = segment_characters(cell_img)
-
-    # 2) group into lines (vertical grouping)
-    lines0 = group_into_lines(raw_pads, raw_chars, line_gap=3)
-
-    # 3) within each line, cluster
-    all_pads, all_chars = [], []
-    merged_lines = []
-    for ln in lines0:
-        pads_i = ln['pads']
-        merged_pads, merged_chars = cluster_pads_and_chars(pads_i, cell_img)
-        merged_lines.append({'pads': merged_pads, 'chars': merged_chars})
-        all_pads.extend(merged_pads)
-        all_chars.extend(merged_chars)
-
-    # 4) per-glyph recognition
-    labels = []
-    for idx, ch in enumerate(all_chars):
-        mask = unified_binarize_char(ch)
-        lbl, score = match_template_ncc_improved(mask, templates)
-        if not lbl:
-            nn_lbl, nn_conf = nn_model(mask)
-            lbl = nn_lbl if nn_conf > 0.7 else '?'
-        labels.append(lbl)
-
-        # per-glyph debug dumps
-        if debug_prefix:
-            cv2.imwrite(f"{debug_prefix}_char_{idx}.png", ch)
-            cv2.imwrite(f"{debug_prefix}_mask_{idx}.png", mask)
-
-    # 5) full‐cell debug
-    if debug_prefix:
-        os.makedirs(os.path.dirname(debug_prefix), exist_ok=True)
-        cv2.imwrite(f"{debug_prefix}_cell.png", cell_img)
-        dbg = cell_img.copy()
-        for (x0,x1,y0,y1), lbl in zip(all_pads, labels):
-            cv2.rectangle(dbg, (x0,y0), (x1,y1), (0,255,0), 1)
-            cv2.putText(dbg, lbl, (x0, max(0,y0-3)),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5, (0,255,0), 1, cv2.LINE_AA)
-        cv2.imwrite(f"{debug_prefix}_recognized.png", dbg)
-
-    # 6) build line_strs from labels + merged_lines
-    line_counts = [len(ln['pads']) for ln in merged_lines]
-    line_strs = []
-    ptr = 0
-    for cnt in line_counts:
-        line_strs.append("".join(labels[ptr:ptr+cnt]))
-        ptr += cnt
-
-    # single line → return raw
-    if len(line_strs) == 1:
-        return line_strs[0]
-
-    # multi-line → RGB parse + drop empty + join with spaces
-    rgb = parse_rgb_from_lines(merged_lines, templates)
-    rgb = [c for c in rgb if c]
-    return " ".join(rgb)
-
-def _process_scan(img):
-    buffer = 6
-
-    # 1) Tile mask
-    tile_bgr = np.array([244,168,103], dtype=np.int16)
-    diff = np.linalg.norm(img.astype(np.int16)
-                         - tile_bgr[None,None,:],
-                         axis=2)
-    tile_mask = (diff < 30).astype(np.uint8) * 255
-    cv2.imwrite(os.path.join(DEBUG_DIR, "10_tile_mask.png"), tile_mask)
-
-    # 2) Contours → candidate tiles
-    cnts,_ = cv2.findContours(tile_mask, cv2.RETR_EXTERNAL,
-                              cv2.CHAIN_APPROX_SIMPLE)
-    cands = []
-    for cnt in cnts:
-        area = cv2.contourArea(cnt)
-        if area < 2000:
-            continue
-        peri = cv2.arcLength(cnt, True)
-        approx = cv2.approxPolyDP(cnt, 0.02*peri, True)
-        if len(approx) != 4:
-            continue
-        x,y,ww,hh = cv2.boundingRect(approx)
-        ar = ww/float(hh) if hh>0 else 0
-        if not 0.7<ar<1.3:
-            continue
-        cands.append((area, x,y,ww,hh, approx))
-    cands.sort(key=lambda t: t[0], reverse=True)
+    # 1-2) Tile candidates, coarse-to-fine (tile_detect.py)
+    cands, tile_mask = detect_tiles(img)
+    debug.save("10_tile_mask.png", tile_mask, "full")
     if len(cands) < 25:
+        if from_roi:
+            # the grid moved: forget it and rescan everything (the grab
+            # has to run on the Tk thread, it hides our windows)
+            print(f"Only {len(cands)} tiles in the last grid region, "
+                  "rescanning the full screen")
+            _forget_scan_roi()
+            app.after(0, scan_puzzle_grid)
+            return
+        if covered:
+            # our windows may sit on top of the grid: look behind them
+            print(f"Only {len(cands)} tiles found with our windows in the "
+                  "way, rescanning with them hidden")
+            app.after(0, lambda: scan_puzzle_grid(hide=True))
+            return
         print(f"Only {len(cands)} tiles found, aborting.")
+        app.after(0, scan_progress.grid_remove)
         return
     tiles = cands[:25]
+    # only where region grabs use the same coordinates (capture.py)
+    scan_roi = _grid_roi(tiles, origin) if capturer.regions else None
+    if scan_roi:
+        print(f"Grid found in {img.shape[1]}x{img.shape[0]} capture; next scans grab "
+              f"{scan_roi['width']}x{scan_roi['height']} at "
+              f"({scan_roi['left']}, {scan_roi['top']})")
 
     # 3) Draw overlay
-    dbg0 = img.copy()
-    for _,x,y,ww,hh,_ in tiles:
-        cv2.rectangle(dbg0,(x,y),(x+ww,y+hh),(0,255,0),2)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "30_tiles_overlay.png"), dbg0)
-
-    # 4) Sort into 5×5
-    ent = []
-    for _,x,y,ww,hh,_ in tiles:
-        ent.append({'cx':x+ww/2,'cy':y+hh/2,
-                        'bbox':(x,y,ww,hh)})
-    ent.sort(key=lambda e: e['cy'])
-    rows = [ent[i*5:(i+1)*5] for i in range(5)]
-    for r in rows:
-        r.sort(key=lambda e: e['cx'])
-
-    # 5) Perspective correction
-    def corners(b): x,y,w,h=b; return [(x,y),(x+w,y),
-                                     (x+w,y+h),(x,y+h)]
-    tl = corners(rows[0][0]['bbox'])[0]
-    tr = corners(rows[0][4]['bbox'])[1]
-    br = corners(rows[4][4]['bbox'])[2]
-    bl = corners(rows[4][0]['bbox'])[3]
-    pts_src = np.array([tl,tr,br,bl], np.float32)
-
-    cell_w = int(np.mean([cell['bbox'][2] for row in rows for cell in row]))
-    cell_h = int(np.mean([cell['bbox'][3] for row in rows for cell in row]))
-    grid_w, grid_h = cell_w*5, cell_h*5
-    warp_w, warp_h = grid_w+2*buffer, grid_h+2*buffer
-
-    pts_dst = np.array([[buffer,buffer],
-                        [warp_w-buffer-1,buffer],
-                        [warp_w-buffer-1,warp_h-buffer-1],
-                        [buffer,warp_h-buffer-1]], np.float32)
-
-    dbg1 = img.copy()
-    for p in pts_src:
-        cv2.circle(dbg1, tuple(p.astype(int)), 8, (0,0,255), -1)
-    cv2.polylines(dbg1,[pts_src.astype(int)],True,(0,255,0),2)
-    cv2.imwrite(os.path.join(DEBUG_DIR,"49_grid_corners.png"), dbg1)
-
-    M = cv2.getPerspectiveTransform(pts_src, pts_dst)
-    warped = cv2.warpPerspective(img, M, (warp_w, warp_h))
-    cv2.imwrite(os.path.join(DEBUG_DIR,"50_grid_warped.png"), warped)
+    if debug.enabled("summary"):
+        dbg0 = to_bgr(img, copy=True)
+        for _,x,y,ww,hh,_ in tiles:
+            cv2.rectangle(dbg0,(x,y),(x+ww,y+hh),(0,255,0),2)
+        debug.save("30_tiles_overlay.png", dbg0)
+
+    # 4-5) Sort into 5×5, perspective correction, cells (tile_detect.py)
+    warped, cells, pts_src = warp_grid(img, tiles)
+
+    if debug.enabled("summary"):
+        dbg1 = to_bgr(img, copy=True)
+        for p in pts_src:
+            cv2.circle(dbg1, tuple(p.astype(int)), 8, (0,0,255), -1)
+        cv2.polylines(dbg1,[pts_src.astype(int)],True,(0,255,0),2)
+        debug.save("49_grid_corners.png", dbg1)
+    debug.save("50_grid_warped.png", warped)
 
     # 6) Load templates
     templates = load_templates()
     if not templates:
         print("No templates found → all via OCR")
-
-    results = [['']*5 for _ in range(5)]
-    for i in range(5):
-      for j in range(5):
-        cell = warped[
-          buffer + i*cell_h : buffer + (i+1)*cell_h,
-          buffer + j*cell_w : buffer + (j+1)*cell_w
-        ]
-        prefix = os.path.join(DEBUG_DIR, f"cell_{i}_{j}")
-        results[i][j] = recognize_cell(
-          cell, templates, predict_char, debug_prefix=prefix
-        )
-
-        def _write():
-          for r in range(5):
-            for c in range(5):
-              e = entries[r][c]
-              e.delete(0,"end")
-              e.insert(0, results[r][c])
-        app.after(0, _write)
+    templates.index.reset_stats()
+    glyph_cache.reset_stats()
+    cell_cache.reset_stats()
+    cascade.reset_stats()
+
+    # per-cell/per-glyph dumps only at the "full" debug level
+    full = debug.enabled("full")
+    prefixes = [debug.path(f"cell_{i}_{j}") if full else None
+                for i in range(5) for j in range(5)]
+
+    # cells stream in as they finish (late NN results too). Updates
+    # that arrive before Tk gets to them are coalesced into one pass
+    # that only touches the entries that changed.
+    pending, done, lock = {}, set(), threading.Lock()
+    first_ms = []
+
+    def _flush():
+      with lock:
+        batch = dict(pending)
+        pending.clear()
+        n_done = len(done)
+      for k, txt in batch.items():
+        e = entries[k // 5][k % 5]
+        e.delete(0, "end")
+        e.insert(0, txt)
+      scan_progress.set(n_done / 25)
+      if n_done == 25:
+        scan_progress.grid_remove()
+
+    def _on_cell(k, txt):
+      with lock:
+        schedule = not pending
+        pending[k] = txt
+        done.add(k)
+      if not first_ms:
+        first_ms.append((time.perf_counter() - t0) * 1000)
+      if schedule:
+        app.after(0, _flush)
+
+    t0 = time.perf_counter()
+    recognize_cells_cached(cells, templates, prefixes, on_cell=_on_cell)
+    scan_ms = (time.perf_counter() - t0) * 1000
+
+    workers = RECOGNITION_WORKERS or os.cpu_count()
+    print(f"Scan: 25 cells in {scan_ms:.0f} ms on {workers} workers, "
+          f"first after {first_ms[0]:.0f} ms, "
+          f"{cell_cache.hits}/25 served from cache")
+    print(index_report(templates))
+    print(glyph_cache.report())
+    print(cascade.report())
+    if debug.enabled():
+        print(debug.report())
 
 def find_highlighted_cell_corners(img, threshold=5):
     """
     Find the 4 corner highlights of a cell.
     Detects both #0047A5 (BGR: 165,71,0) and #014EA7 (BGR: 167,78,1).
     """
-    # Define both highlight colors in BGR
-    highlight_bgrs = [
-        (165, 71, 0),   # #0047A5
-        (167, 78, 1),   # #014ea7
-    ]
+    # Define both highlight colors in BGR (distance <= threshold matches)
+    highlight_colors = {
+        "#0047A5": ((165, 71, 0), threshold, True),
+        "#014EA7": ((167, 78, 1), threshold, True),
+    }
     
-    # Create a combined mask for all highlight colors
-    mask = np.zeros(img.shape[:2], dtype=np.uint8)
-    for highlight_bgr in highlight_bgrs:
-        diff = np.linalg.norm(
-            img.astype(np.int16) - np.array(highlight_bgr, dtype=np.int16), axis=2
-        )
-        mask = cv2.bitwise_or(mask, (diff <= threshold).astype(np.uint8) * 255)
+    # One labeling pass for both highlight colors (color_mask.py)
+    mask = color_classifier(highlight_colors).mask(img)
     
     # Save debug images
-    cv2.imwrite(os.path.join(DEBUG_DIR, "01_corner_mask.png"), mask)
+    debug.save("01_corner_mask.png", mask, "full")
     
     # Create visualization
-    result = img.copy()
-    result[mask > 0] = [0, 255, 0]  # Green highlights for visibility
-    cv2.imwrite(os.path.join(DEBUG_DIR, "02_corners_highlighted.png"), result)
+    if debug.enabled("full"):
+        result = to_bgr(img, copy=True)
+        result[mask > 0] = [0, 255, 0]  # Green highlights for visibility
+        debug.save("02_corners_highlighted.png", result, "full")
     
     # Find contours
     cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -1779,12 +1437,13 @@ def find_highlighted_cell_corners(img, threshold=5):
     if len(centers) != 4:
         print(f"Expected 4 corners, found {len(centers)}")
         # Save debug image with all detected centers
-        debug_img = img.copy()
-        for i, center in enumerate(centers):
-            cv2.circle(debug_img, center, 5, (0, 255, 0), -1)
-            cv2.putText(debug_img, str(i), (center[0]+10, center[1]), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-        cv2.imwrite(os.path.join(DEBUG_DIR, "03_all_corners.png"), debug_img)
+        if debug.enabled("summary"):
+            debug_img = to_bgr(img, copy=True)
+            for i, center in enumerate(centers):
+                cv2.circle(debug_img, center, 5, (0, 255, 0), -1)
+                cv2.putText(debug_img, str(i), (center[0]+10, center[1]), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            debug.save("03_all_corners.png", debug_img)
         return None
     
     # Sort corners: top-left, top-right, bottom-right, bottom-left
@@ -1796,14 +1455,15 @@ def find_highlighted_cell_corners(img, threshold=5):
     corners = [tl, tr, br, bl]
     
     # Save debug image with sorted corners
-    debug_img = img.copy()
-    corner_labels = ['TL', 'TR', 'BR', 'BL']
-    corner_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
-    for corner, label, color in zip(corners, corner_labels, corner_colors):
-        cv2.circle(debug_img, corner, 8, color, -1)
-        cv2.putText(debug_img, label, (corner[0]+12, corner[1]), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "04_sorted_corners.png"), debug_img)
+    if debug.enabled("summary"):
+        debug_img = to_bgr(img, copy=True)
+        corner_labels = ['TL', 'TR', 'BR', 'BL']
+        corner_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+        for corner, label, color in zip(corners, corner_labels, corner_colors):
+            cv2.circle(debug_img, corner, 8, color, -1)
+            cv2.putText(debug_img, label, (corner[0]+12, corner[1]), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        debug.save("04_sorted_corners.png", debug_img)
     
     return corners
 
@@ -1837,24 +1497,25 @@ def extract_cell_content(img, corners):
     y2 = min(img.shape[0], y2)
     
     # Extract cell region
-    cell_img = img[y1:y2, x1:x2]
+    cell_img = to_bgr(img[y1:y2, x1:x2])
     
     if cell_img.size == 0:
         print("Empty cell region")
         return None
     
     # Save the extracted cell
-    cv2.imwrite(os.path.join(DEBUG_DIR, "05_extracted_cell.png"), cell_img)
+    debug.save("05_extracted_cell.png", cell_img, "full")
     
     # Find white text in the cell
     white_text_img = isolate_white_text(cell_img)
     
     # Save debug image showing bounding box on original
-    debug_img = img.copy()
-    cv2.rectangle(debug_img, (x1, y1), (x2, y2), (0, 255, 255), 2)
-    for corner in corners:
-        cv2.circle(debug_img, corner, 5, (255, 0, 255), -1)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "06_cell_bounds.png"), debug_img)
+    if debug.enabled("full"):
+        debug_img = to_bgr(img, copy=True)
+        cv2.rectangle(debug_img, (x1, y1), (x2, y2), (0, 255, 255), 2)
+        for corner in corners:
+            cv2.circle(debug_img, corner, 5, (255, 0, 255), -1)
+        debug.save("06_cell_bounds.png", debug_img, "full")
     
     return cell_img, white_text_img, (x1, y1, x2, y2)
 
@@ -1877,8 +1538,8 @@ def isolate_white_text(cell_img, white_threshold=240):
     binary_result[white_mask] = 255
     
     # Save debug images
-    cv2.imwrite(os.path.join(DEBUG_DIR, "07_white_text_color.png"), result)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "08_white_text_binary.png"), binary_result)
+    debug.save("07_white_text_color.png", result, "full")
+    debug.save("08_white_text_binary.png", binary_result, "full")
     
     print(f"Found {np.sum(white_mask)} white pixels in cell")
     
@@ -1919,27 +1580,28 @@ def perspective_correct_single_cell(img, corners, cell_size=100):
     ], dtype=np.float32)
     
     # Draw debug overlay showing source corners
-    debug_img = img.copy()
-    corner_labels = ['TL', 'TR', 'BR', 'BL']
-    corner_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
-    
-    for i, (pt, label, color) in enumerate(zip(pts_src, corner_labels, corner_colors)):
-        cv2.circle(debug_img, tuple(np.int32(pt)), 8, color, -1)
-        cv2.putText(debug_img, label, (int(pt[0])+12, int(pt[1])), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-    
-    # Draw the quadrilateral
-    cv2.polylines(debug_img, [np.int32(pts_src)], isClosed=True, color=(0,255,255), thickness=2)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "09_perspective_corners.png"), debug_img)
+    if debug.enabled("full"):
+        debug_img = to_bgr(img, copy=True)
+        corner_labels = ['TL', 'TR', 'BR', 'BL']
+        corner_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+        
+        for i, (pt, label, color) in enumerate(zip(pts_src, corner_labels, corner_colors)):
+            cv2.circle(debug_img, tuple(np.int32(pt)), 8, color, -1)
+            cv2.putText(debug_img, label, (int(pt[0])+12, int(pt[1])), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        
+        # Draw the quadrilateral
+        cv2.polylines(debug_img, [np.int32(pts_src)], isClosed=True, color=(0,255,255), thickness=2)
+        debug.save("09_perspective_corners.png", debug_img, "full")
     
     # Compute perspective transformation matrix
     M = cv2.getPerspectiveTransform(pts_src, pts_dst)
     
     # Apply perspective correction
-    corrected_cell = cv2.warpPerspective(img, M, (cell_size, cell_size))
+    corrected_cell = to_bgr(cv2.warpPerspective(img, M, (cell_size, cell_size)))
     
     # Save debug images
-    cv2.imwrite(os.path.join(DEBUG_DIR, "10_corrected_cell.png"), corrected_cell)
+    debug.save("10_corrected_cell.png", corrected_cell, "full")
     
     print(f"Applied perspective correction to create {cell_size}x{cell_size} cell")
     
@@ -1962,8 +1624,8 @@ def extract_and_correct_cell(img, corners, cell_size=100):
     white_text_color, white_text_binary = isolate_white_text(corrected_cell)
     
     # Save the final results
-    cv2.imwrite(os.path.join(DEBUG_DIR, "11_final_corrected_cell.png"), corrected_cell)
-    cv2.imwrite(os.path.join(DEBUG_DIR, "12_final_white_text.png"), white_text_binary)
+    debug.save("11_final_corrected_cell.png", corrected_cell)
+    debug.save("12_final_white_text.png", white_text_binary)
     
     return {
         'corrected_cell': corrected_cell,
@@ -1991,208 +1653,29 @@ def validate_corners(corners):
     print(f"Corners validated. Approximate cell size: {width}x{height}")
     return True
 
-def group_characters_into_lines(chars_out, pads_out):
-    """
-    Group characters into lines using the same logic as segment_characters
-    Returns list of line dictionaries with chars and pads
-    """
-    if len(chars_out) <= 1:
-        return [{'chars': chars_out, 'pads': pads_out}] if chars_out else []
-    
-    # Use the same line grouping logic as segment_characters
-    lines = []
-    for pad, char in sorted(zip(pads_out, chars_out), key=lambda t: t[0][2]):  # sort by y (top)
-        x0, x1, y0, y1 = pad
-        placed = False
-        for line in lines:
-            if any(y0 <= prev_y1 for _, _, _, prev_y1 in line['pads']):
-                line['chars'].append(char)
-                line['pads'].append(pad)
-                placed = True
-                break
-        if not placed:
-            lines.append({'chars': [char], 'pads': [pad]})
-    
-    # Sort characters within each line left-to-right
-    for line in lines:
-        line_sorted = sorted(zip(line['pads'], line['chars']), key=lambda t: t[0][0])
-        line['pads'] = [pad for pad, char in line_sorted]
-        line['chars'] = [char for pad, char in line_sorted]
-    
-    return lines
-
-def detect_gaps_in_line(pads, gap_threshold_ratio=1.0):
-    """
-    Detect significant gaps between characters in a line
-    
-    Args:
-        pads: List of character bounding boxes in the line
-        gap_threshold_ratio: Minimum gap as ratio of average character width
-    
-    Returns:
-        gap_positions: List of indices where significant gaps occur
-    """
-    if len(pads) < 2:
-        return []
-    
-    # Calculate average character width
-    char_widths = [x1 - x0 for x0, x1, y0, y1 in pads]
-    avg_char_width = sum(char_widths) / len(char_widths)
-    gap_threshold = avg_char_width * gap_threshold_ratio
-    
-    gaps = []
-    for i in range(len(pads) - 1):
-        current_x1 = pads[i][1]
-        next_x0 = pads[i + 1][0]
-        gap_size = next_x0 - current_x1
-        
-        if gap_size > gap_threshold:
-            gaps.append(i + 1)  # Gap after character i
-    
-    return gaps
-
-def recognize_line_text(chars, templates):
-    """
-    Recognize text from a line of characters
-    
-    Args:
-        chars: List of character images
-        templates: Template dictionary for matching
-    
-    Returns:
-        recognized_text: String of recognized characters
-    """
-    recognized = []
-    
-    for idx, ch in enumerate(chars):
-        # Binarize character using foreground color method (white text)
-        tbin = unified_binarize_char(ch)
-        
-        # Try template matching first
-        label, score = match_template_ncc_improved(tbin, templates)
-        if label:
-            recognized.append(label)
-        else:
-            # Fall back to neural network prediction
-            nn_label, nn_conf = predict_char(tbin)
-            if nn_conf > 0.7:
-                recognized.append(nn_label)
-            else:
-                recognized.append('?')
-                save_unknown(tbin, 0, 0, idx)
-    
-    return "".join(recognized)
-
-def parse_rgb_from_lines(lines, templates):
-    """
-    Parse R/G/B values from detected lines
-    Minimum is 2 lines, maximum is 3 lines
-    
-    Args:
-        lines: List of line dictionaries from group_characters_into_lines
-        templates: Template dictionary for character recognition
-    
-    Returns:
-        [R_value, G_value, B_value]
-    """
-    if len(lines) == 3:
-        # Each line is a separate R/G/B component
-        r_value = recognize_line_text(lines[0]['chars'], templates)
-        g_value = recognize_line_text(lines[1]['chars'], templates)
-        b_value = recognize_line_text(lines[2]['chars'], templates)
-        
-        print(f"3 lines detected: R='{r_value}', G='{g_value}', B='{b_value}'")
-        return [r_value, g_value, b_value]
-    
-    elif len(lines) == 2:
-        # One line has two components, other has one
-        # Detect which line has the gap
-        line1_gaps = detect_gaps_in_line(lines[0]['pads'])
-        line2_gaps = detect_gaps_in_line(lines[1]['pads'])
-        
-        if line1_gaps and not line2_gaps:
-            # First line has two components, second line has one
-            line2_text = recognize_line_text(lines[1]['chars'], templates)
-            
-            # Split first line at the gap
-            gap_pos = line1_gaps[0]
-            part1_chars = lines[0]['chars'][:gap_pos]
-            part2_chars = lines[0]['chars'][gap_pos:]
-            
-            part1_text = recognize_line_text(part1_chars, templates)
-            part2_text = recognize_line_text(part2_chars, templates)
-            
-            print(f"2 lines: Line1 split at gap: '{part1_text}' + '{part2_text}', Line2: '{line2_text}'")
-            return [part1_text, part2_text, line2_text]
-        
-        elif line2_gaps and not line1_gaps:
-            # Second line has two components, first line has one
-            line1_text = recognize_line_text(lines[0]['chars'], templates)
-            
-            # Split second line at the gap
-            gap_pos = line2_gaps[0]
-            part1_chars = lines[1]['chars'][:gap_pos]
-            part2_chars = lines[1]['chars'][gap_pos:]
-            
-            part1_text = recognize_line_text(part1_chars, templates)
-            part2_text = recognize_line_text(part2_chars, templates)
-            
-            print(f"2 lines: Line1: '{line1_text}', Line2 split at gap: '{part1_text}' + '{part2_text}'")
-            return [line1_text, part1_text, part2_text]
-        
-        else:
-            # No clear gaps or multiple gaps - fall back to simple split
-            # Assume first line is R, second line is G, B is empty
-            line1_text = recognize_line_text(lines[0]['chars'], templates)
-            line2_text = recognize_line_text(lines[1]['chars'], templates)
-            
-            print(f"2 lines (no clear gaps): R='{line1_text}', G='{line2_text}', B=''")
-            return [line1_text, line2_text, ""]
-    
-    else:
-        print(f"Unexpected number of lines: {len(lines)} (minimum should be 2)")
-        if len(lines) == 1:
-            # Fallback: try to detect gaps in the single line
-            gaps = detect_gaps_in_line(lines[0]['pads'])
-            
-            if len(gaps) >= 2:
-                # Split into three parts
-                chars = lines[0]['chars']
-                part1_chars = chars[:gaps[0]]
-                part2_chars = chars[gaps[0]:gaps[1]]
-                part3_chars = chars[gaps[1]:]
-                
-                part1_text = recognize_line_text(part1_chars, templates)
-                part2_text = recognize_line_text(part2_chars, templates)
-                part3_text = recognize_line_text(part3_chars, templates)
-                
-                print(f"1 line with 2 gaps (fallback): '{part1_text}', '{part2_text}', '{part3_text}'")
-                return [part1_text, part2_text, part3_text]
-            
-            elif len(gaps) == 1:
-                # Split into two parts
-                chars = lines[0]['chars']
-                part1_chars = chars[:gaps[0]]
-                part2_chars = chars[gaps[0]:]
-                
-                part1_text = recognize_line_text(part1_chars, templates)
-                part2_text = recognize_line_text(part2_chars, templates)
-                
-                print(f"1 line with 1 gap (fallback): '{part1_text}', '{part2_text}', ''")
-                return [part1_text, part2_text, ""]
-            
-            else:
-                # No gaps - single component
-                line_text = recognize_line_text(lines[0]['chars'], templates)
-                print(f"1 line (no gaps, fallback): '{line_text}', '', ''")
-                return [line_text, "", ""]
-        
-        return ["", "", ""]
+def _grab_highlighted_cell():
+    """Screenshot and highlight corners, or (None, None). Tries the last
+       known grid area first, then the whole screen, then the whole
+       screen with our windows hidden if they covered part of it."""
+    covered = False
+    for region in ([scan_roi] if scan_roi and capturer.regions else []) + [None]:
+      img, _, cov = grab_screen(region)
+      covered = covered or cov
+      corners = find_highlighted_cell_corners(img) if img is not None else None
+      if corners and validate_corners(corners):
+        return img, corners
+    if covered:
+      print("Corner detection failed, retrying with our windows hidden")
+      img = grab_screen(hide=True)[0]
+      corners = find_highlighted_cell_corners(img) if img is not None else None
+      if corners and validate_corners(corners):
+        return img, corners
+    return None, None
 
 def single_cell_mode_capture_and_insert():
-    img = grab_full_screen()
-    corners = find_highlighted_cell_corners(img)
-    if not corners or not validate_corners(corners):
+    debug.new_scan("cell")
+    img, corners = _grab_highlighted_cell()
+    if img is None:
       print("Corner detection failed"); return
 
     result = extract_and_correct_cell(img, corners, cell_size=90)
@@ -2201,17 +1684,30 @@ def single_cell_mode_capture_and_insert():
 
     corrected = result['corrected_cell']
     templates = load_templates()
-    prefix = os.path.join(DEBUG_DIR, "single_cell")
-    txt = recognize_cell(
-      corrected, templates, predict_char, debug_prefix=prefix
-    )
-
-    for row in entries:
-      for e in row:
-        if not e.get():
-          e.insert(0, txt)
-          print(f"Inserted '{txt}'"); return
-    print("No empty cell")
+    glyph_cache.reset_stats()
+    cell_cache.reset_stats()
+    cascade.reset_stats()
+    prefix = debug.path("single_cell") if debug.enabled("full") else None
+    target = next((e for row in entries for e in row if not e.get()), None)
+
+    def _late(texts):
+      def _replace():
+        if target is not None and target.get() == txt:
+          target.delete(0, "end")
+          target.insert(0, texts[0])
+          print(f"Updated '{txt}' → '{texts[0]}'")
+      app.after(0, _replace)
+
+    txt = recognize_cells_cached([corrected], templates, [prefix], on_update=_late)[0]
+    if cell_cache.hits:
+        print("Cell unchanged, served from cache")
+    else:
+        print(cascade.report())
+
+    if target is None:
+      print("No empty cell"); return
+    target.insert(0, txt)
+    print(f"Inserted '{txt}'")
 
 if IS_WAYLAND:
     def hotkey_listener_thread():
@@ -2276,6 +1772,9 @@ inputlabel = ctk.CTkLabel(grid1,
                          font=("", 20))
 inputlabel.grid(row=0, column=0, columnspan=5, pady=5)
 
+# shown under the grid while a scan is filling it in
+scan_progress = ctk.CTkProgressBar(grid1, height=4)
+
 solve_button = ctk.CTkButton(grid2,
                            width=100,
                            text="Solve",
@@ -2371,4 +1870,15 @@ if IS_LINUX:
     else:
         print("X11 detected - full clickthrough support available")
 
+def _on_window_shown():
+    print(f"Startup: window up after {time.perf_counter() - STARTUP_T0:.2f} s")
+    # recognizer warm-up off the UI thread; scans before it finishes
+    # use templates and queue their NN glyphs (the pool is already up)
+    char_predictor.start_loading()
+    threading.Thread(target=load_templates, daemon=True).start()
+
+app.after(0, _on_window_shown)
 app.mainloop()
+glyph_cache.save()
+debug.flush()
+capturer.close()
@@ -0,0 +1,834 @@
+# benchmark.py
+# Offline timing/accuracy checks for the recognition pipeline.
+#   python benchmark.py ncc [--glyphs N]
+#   python benchmark.py canonical
+#   python benchmark.py bits
+#   python benchmark.py index [--mode resize|canonical|bits]
+#   python benchmark.py medoids [--mode resize|canonical|bits] [--folds N]
+#   python benchmark.py nn [--backends keras,onnx,numpy,onnx-int8]
+#   python benchmark.py cascade [--folds N] [--orders templates,nn;nn,templates]
+#   python benchmark.py workers [--scans N] [--modes threads,processes]
+#   python benchmark.py shared [--rounds N]
+#   python benchmark.py tiles [--reps N]
+#   python benchmark.py colors [--reps N]
+#   python benchmark.py capture [--reps N]
+#   python benchmark.py grim [--reps N]
+#   python benchmark.py replay [--frames DIR]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import cv2
+
+import template_bank
+from template_bank import LABEL_FILE, CANONICAL_SIZE
+from template_bank import (build_template_bank, count_holes,
+                           match_template_ncc_improved, score_templates,
+                           canonicalize, pack_bits, popcount, glyph_features,
+                           label_medoids)
+
+
+def match_template_ncc_loop(char_bin, bank, ncc_thresh=0.65,
+                            fill_penalty_w=0.5, hole_penalty_w=0.7):
+    """The original one-template-at-a-time matcher, kept as the reference."""
+    holes_char = count_holes(char_bin)
+    best_label = None
+    best_score = -1.0
+    for label, tmpl in zip(bank.labels, bank.images):
+        tmpl_rs = cv2.resize(tmpl, (char_bin.shape[1], char_bin.shape[0]), interpolation=cv2.INTER_AREA)
+        _, tmpl_bin = cv2.threshold(tmpl_rs, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if np.mean(tmpl_bin) > 127:
+            tmpl_bin = 255 - tmpl_bin
+        res = cv2.matchTemplate(char_bin.astype(np.float32),
+                                tmpl_bin.astype(np.float32),
+                                cv2.TM_CCOEFF_NORMED)
+        ncc_score = float(res[0,0])
+        nonneg = np.logical_and(tmpl_bin == 0, char_bin == 255)
+        fill_penalty = fill_penalty_w * (np.sum(nonneg) / nonneg.size)
+        holes_tmpl = count_holes(tmpl_bin)
+        hole_penalty = hole_penalty_w * abs(holes_char - holes_tmpl) / max(holes_tmpl, 1)
+        score = ncc_score - fill_penalty - hole_penalty
+        if score > best_score:
+            best_score = score
+            best_label = label
+    if best_score < ncc_thresh:
+        return None, best_score
+    return best_label, best_score
+
+def sample_glyphs(bank, n, seed=0):
+    """n corpus glyphs (with their true labels), spread over the label set."""
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(len(bank), size=min(n, len(bank)), replace=False)
+    return [(bank.images[k], bank.labels[k]) for k in idx]
+
+def _timed(fn, glyphs, prime=False):
+    """ms/glyph for fn; prime=True runs each glyph once untimed first."""
+    out, total = [], 0.0
+    for g, _ in glyphs:
+        if prime:
+            fn(g)
+        t0 = time.perf_counter()
+        out.append(fn(g))
+        total += time.perf_counter() - t0
+    return out, total * 1000 / max(len(glyphs), 1)
+
+
+def bench_ncc(args):
+    bank = build_template_bank()
+    glyphs = sample_glyphs(bank, args.glyphs)
+    print(f"{len(bank)} templates, {len(glyphs)} glyphs, "
+          f"{len({g.shape for g, _ in glyphs})} distinct glyph sizes")
+
+    ref, t_loop = _timed(lambda g: match_template_ncc_loop(g, bank), glyphs)
+    cold, t_cold = _timed(lambda g: match_template_ncc_improved(g, bank), glyphs)
+    warm, t_warm = _timed(lambda g: match_template_ncc_improved(g, bank), glyphs, prime=True)
+
+    same = sum(a[0] == b[0] for a, b in zip(ref, warm))
+    diff = max(abs(a[1] - b[1]) for a, b in zip(ref, warm))
+    print(f"  per-template loop : {t_loop:8.2f} ms/glyph")
+    print(f"  batched, cold     : {t_cold:8.2f} ms/glyph  (first glyph of a new size)")
+    print(f"  batched, warm     : {t_warm:8.2f} ms/glyph  ({t_loop/t_warm:.0f}x, size already stacked)")
+    print(f"  same label {same}/{len(glyphs)}, max |score diff| {diff:.2e}")
+
+
+def leave_one_out(bank, score_fn, ncc_thresh=0.65):
+    """
+    Classify every corpus glyph against the rest of the bank.
+    score_fn(k) → (N,) scores for glyph k. Returns (correct, rejected,
+    confusions {(true, predicted): count}, ms/glyph).
+    """
+    correct = rejected = 0
+    confusions = {}
+    t0 = time.perf_counter()
+    for k in range(len(bank)):
+        scores = score_fn(k)
+        scores[k] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < ncc_thresh:
+            rejected += 1
+        elif bank.labels[best] == bank.labels[k]:
+            correct += 1
+        else:
+            key = (bank.labels[k], bank.labels[best])
+            confusions[key] = confusions.get(key, 0) + 1
+    ms = (time.perf_counter() - t0) * 1000 / max(len(bank), 1)
+    return correct, rejected, confusions, ms
+
+def _report_loo(name, bank, result):
+    correct, rejected, confusions, ms = result
+    n = len(bank)
+    wrong = n - correct - rejected
+    print(f"  {name:<22}: {correct}/{n} correct ({100*correct/n:.2f}%), "
+          f"{rejected} rejected, {wrong} wrong, {ms:.2f} ms/glyph")
+    for (t, p), c in sorted(confusions.items(), key=lambda kv: -kv[1]):
+        print(f"      {t!r} read as {p!r} x{c}")
+
+def bench_canonical(args):
+    bank = build_template_bank()
+    sizes = {img.shape for img in bank.images}
+    print(f"Leave-one-out over {len(bank)} labeled glyphs in {LABEL_FILE} "
+          f"({len(sizes)} distinct glyph sizes)")
+
+    # resize mode: visit glyphs grouped by size so each size's stack is
+    # built exactly once (that build is included in the timing)
+    by_size = sorted(range(len(bank)), key=lambda k: bank.images[k].shape)
+    t0 = time.perf_counter()
+    resize_scores = {k: score_templates(bank.images[k], bank, mode="resize")
+                     for k in by_size}
+    resize_ms = (time.perf_counter() - t0) * 1000 / len(bank)
+    res = leave_one_out(bank, lambda k: resize_scores[k].copy())
+    _report_loo("resize-the-template", bank, res[:3] + (resize_ms,))
+
+    res = leave_one_out(bank, lambda k: score_templates(bank.images[k], bank,
+                                                        mode="canonical"))
+    _report_loo(f"canonical {CANONICAL_SIZE}x{CANONICAL_SIZE}", bank, res)
+
+
+def bench_bits(args):
+    bank = build_template_bank()
+    n = len(bank)
+    stack = bank.canonical_stack()
+    print(f"{n} templates at {CANONICAL_SIZE}x{CANONICAL_SIZE}")
+    print(f"  uint8 0/1 masks     : {n * CANONICAL_SIZE**2 / 1024:8.1f} KiB")
+    print(f"  float32 stack       : {stack.fg.nbytes / 1024:8.1f} KiB")
+    print(f"  bit-packed          : {bank.canon_bits.nbytes / 1024:8.1f} KiB "
+          f"({n * CANONICAL_SIZE**2 / bank.canon_bits.nbytes:.0f}x smaller than uint8)")
+
+    g_bits = pack_bits(canonicalize(bank.images[0]))
+    reps = 2000
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        popcount(bank.canon_bits & g_bits)
+    scan_us = (time.perf_counter() - t0) * 1e6 / reps
+    print(f"  full-bank AND+popcount scan: {scan_us:.1f} us")
+
+    glyphs = sample_glyphs(bank, 200)
+    _, t_bits = _timed(lambda g: match_template_ncc_improved(g, bank, mode="bits"), glyphs)
+    _, t_canon = _timed(lambda g: match_template_ncc_improved(g, bank, mode="canonical"), glyphs)
+    print(f"  per glyph incl. resize/holes: bits {t_bits*1000:.0f} us, "
+          f"canonical float {t_canon*1000:.0f} us")
+
+    print(f"Leave-one-out over {n} labeled glyphs")
+    default = template_bank.BITS_SIMILARITY
+    for similarity in ("jaccard", "hamming"):
+        template_bank.BITS_SIMILARITY = similarity
+        res = leave_one_out(bank, lambda k: score_templates(bank.images[k], bank, mode="bits"))
+        _report_loo(f"bits/{similarity}", bank, res)
+    template_bank.BITS_SIMILARITY = default
+    res = leave_one_out(bank, lambda k: score_templates(bank.images[k], bank, mode="canonical"))
+    _report_loo("canonical float NCC", bank, res)
+
+
+def bench_index(args):
+    bank = build_template_bank()
+    n = len(bank)
+    print(f"Feature index over {n} templates "
+          f"({'KD-tree' if bank.index.tree is not None else 'brute force'}), "
+          f"{bank.features.shape[1]}-d descriptors, mode={args.mode}")
+
+    # a pruned score is just the full score at the candidate indices, so
+    # score everything once per glyph and mask per k
+    by_size = sorted(range(n), key=lambda k: bank.images[k].shape)
+    full = {k: score_templates(bank.images[k], bank, mode=args.mode) for k in by_size}
+    feats = {k: glyph_features(bank.images[k]) for k in range(n)}
+
+    glyphs = sample_glyphs(bank, 200)
+    for prune_k in (0, 8, 16, 32, 64, 128):
+        def score_fn(k):
+            if not prune_k:
+                return full[k].copy()
+            cand = bank.index.query(feats[k], prune_k + 1)
+            masked = np.full(n, -np.inf)
+            masked[cand] = full[k][cand]
+            return masked
+        bank.index.reset_stats()
+        res = leave_one_out(bank, score_fn)
+        ratio = bank.index.pruning_ratio()
+        _, ms = _timed(lambda g: match_template_ncc_improved(g, bank, mode=args.mode,
+                                                             prune_k=prune_k),
+                       glyphs, prime=True)
+        name = f"k={prune_k}" if prune_k else "no pruning"
+        _report_loo(f"{name:<10} {ratio:6.1%} pruned", bank, res[:3] + (ms,))
+
+
+def bench_medoids(args):
+    """k-fold cross-validation: medoids come from the training folds only."""
+    bank = build_template_bank()
+    n = len(bank)
+    rng = np.random.default_rng(0)
+    fold_of = rng.integers(0, args.folds, size=n)
+    print(f"{args.folds}-fold CV over {n} labeled glyphs, mode={args.mode}")
+
+    for k in (1, 2, 3, 5, 8, 12, 0):
+        correct = rejected = n_tmpl = 0
+        warm = cold = 0.0
+        for fold in range(args.folds):
+            train = np.flatnonzero(fold_of != fold)
+            test = np.flatnonzero(fold_of == fold)
+            sub = bank.subset(train)
+            if k:
+                sub = sub.subset(label_medoids(sub, k))
+            n_tmpl += len(sub)
+
+            test = sorted(test, key=lambda t: bank.images[t].shape)
+            glyphs = [(bank.images[t], bank.labels[t]) for t in test]
+            match = lambda g: match_template_ncc_improved(g, sub, mode=args.mode)
+            results, ms = _timed(match, glyphs)
+            cold += ms * len(test)
+            _, ms = _timed(match, glyphs, prime=True)
+            warm += ms * len(test)
+
+            for t, (lbl, _) in zip(test, results):
+                if lbl is None:
+                    rejected += 1
+                elif lbl == bank.labels[t]:
+                    correct += 1
+        name = f"{k} medoids/label" if k else "all samples"
+        print(f"  {name:<16}: {n_tmpl / args.folds:6.0f} templates, "
+              f"{correct}/{n} correct ({100*correct/n:.2f}%), {rejected} rejected, "
+              f"{n - correct - rejected} wrong, "
+              f"{cold/n:.2f} ms/glyph cold, {warm/n:.2f} ms/glyph warm")
+
+
+NN_BATCH_SIZES = (1, 8, 25, 64)
+
+def _rss_mb():
+    """Resident set size of this process in MiB."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def _nn_child(args):
+    """Runs in a fresh interpreter so imports and model load are really cold."""
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    import char_predictor
+    char_predictor.get_backend()
+    load_s = time.perf_counter() - t0
+    rss1 = _rss_mb()
+
+    bank = build_template_bank()
+    masks = [img for img, _ in sample_glyphs(bank, max(NN_BATCH_SIZES))]
+    t0 = time.perf_counter()
+    char_predictor.predict_chars(masks[:1])
+    first_ms = (time.perf_counter() - t0) * 1000
+
+    batch_ms = {}
+    for n in NN_BATCH_SIZES:
+        times = []
+        for _ in range(20):
+            t0 = time.perf_counter()
+            char_predictor.predict_chars(masks[:n])
+            times.append(time.perf_counter() - t0)
+        batch_ms[n] = 1000 * float(np.median(times))
+
+    labels = [lbl for lbl, _ in char_predictor.predict_chars(masks)]
+    print(json.dumps({"backend": char_predictor.backend.name, "load_s": load_s,
+                      "rss_mb": _rss_mb(), "model_mb": rss1 - rss0,
+                      "first_ms": first_ms, "batch_ms": batch_ms, "labels": labels}))
+
+def bench_nn(args):
+    """Cold start, resident memory and batch latency per NN backend."""
+    if args.child:
+        return _nn_child(args)
+    results = []
+    for name in args.backends.split(","):
+        env = dict(os.environ, HPSOLVER_NN_BACKEND=name, TF_CPP_MIN_LOG_LEVEL="3")
+        proc = subprocess.run([sys.executable, __file__, "nn", "--child"],
+                              env=env, capture_output=True, text=True)
+        if proc.returncode:
+            print(f"{name}: failed\n{proc.stderr.strip().splitlines()[-1]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    for r in results:
+        lat = ", ".join(f"{n}: {ms:.2f}" for n, ms in r["batch_ms"].items())
+        print(f"{r['backend']:<6}: import+load {r['load_s']:.2f} s, "
+              f"+{r['model_mb']:.0f} MiB ({r['rss_mb']:.0f} MiB resident), "
+              f"first call {r['first_ms']:.1f} ms, ms/batch {{{lat}}}")
+    for r in results[1:]:
+        same = np.mean([a == b for a, b in zip(results[0]["labels"], r["labels"])])
+        print(f"{r['backend']} vs {results[0]['backend']}: {same:.1%} same labels "
+              f"on {len(r['labels'])} glyphs")
+
+
+CASCADE_ORDERS = "templates,nn;templates,full,nn;full,nn;nn,templates;nn,templates,full;nn"
+
+def bench_cascade(args):
+    """
+    Accuracy, latency and per-stage hit rate for each stage order, with
+    templates from the other folds. The NN saw every glyph in training,
+    so its numbers are optimistic.
+    """
+    from cascade import build_cascade
+    import char_predictor
+
+    bank = build_template_bank()
+    n = len(bank)
+    fold_of = np.random.default_rng(0).integers(0, args.folds, size=n)
+    char_predictor.get_backend()
+    print(f"{args.folds}-fold CV over {n} labeled glyphs, "
+          f"NN backend {char_predictor.backend.name} "
+          f"(template stacks are built cold for every fold)")
+
+    for order in args.orders.split(";"):
+        casc = build_cascade(order.split(","), predict_batch=char_predictor.predict_chars)
+        correct = wrong = 0
+        seconds = 0.0
+        for fold in range(args.folds):
+            sub = bank.subset(np.flatnonzero(fold_of != fold))
+            test = np.flatnonzero(fold_of == fold)
+            masks = [bank.images[t] for t in test]
+            t0 = time.perf_counter()
+            labels, _, _, _ = casc.classify(masks, sub)
+            seconds += time.perf_counter() - t0
+            for t, lbl in zip(test, labels):
+                if lbl is None:
+                    continue
+                if lbl == bank.labels[t]:
+                    correct += 1
+                else:
+                    wrong += 1
+        print(f"  {' → '.join(order.split(',')):<24}: {correct}/{n} correct "
+              f"({100*correct/n:.2f}%), {wrong} wrong, {n-correct-wrong} unresolved, "
+              f"{1000*seconds/n:.2f} ms/glyph")
+        print(f"    {casc.report()}")
+
+
+def synthetic_scan(bank, seed=0, size=130):
+    """
+    25 cells like a puzzle-4 grid: three lines of white corpus digits
+    (R, G, B, glyphs from the ~29 px size class) on a dark tile.
+    Returns (cells, expected texts).
+    """
+    rng = np.random.default_rng(seed)
+    by_label = {}
+    for k, lbl in enumerate(bank.labels):
+        if lbl.isdigit() and 28 <= bank.images[k].shape[0] <= 31:
+            # corpus polarity is mixed; the ink is the way round that
+            # forms one component spanning the whole crop
+            for g in (bank.images[k], 255 - bank.images[k]):
+                n, _, stats, _ = cv2.connectedComponentsWithStats((g > 0).astype(np.uint8))
+                blobs = [st for st in stats[1:] if st[4] >= 10]
+                if len(blobs) == 1 and tuple(blobs[0][2:4]) == (g.shape[1], g.shape[0]):
+                    by_label.setdefault(lbl, []).append(g)
+                    break
+    cells, expected = [], []
+    for _ in range(25):
+        cell = np.full((size, size, 3), 24, np.uint8)
+        values, y = [], 8
+        for _ in range(3):
+            value = str(rng.integers(0, 256))
+            x, line_h = 10, 0
+            for ch in value:
+                imgs = by_label[ch]
+                g = imgs[rng.integers(len(imgs))]
+                h, w = g.shape
+                cell[y:y+h, x:x+w][g > 0] = 235
+                x += w + 2
+                line_h = max(line_h, h)
+            values.append(value)
+            y += line_h + 8
+        cells.append(cell)
+        expected.append(" ".join(values))
+    return cells, expected
+
+def bench_workers(args):
+    """
+    Wall-clock per 25-cell scan for 1, 2, 4 and one-per-CPU workers, per
+    pool mode, through recognize_cells_cached (the app's path; cell cache
+    cleared too) with the time to the first streamed cell. Pool start-up (forking, attaching the shared bank) is timed
+    apart from the scans, since the app pays it once per session.
+    """
+    import recognition
+    import char_predictor
+
+    bank = recognition.load_templates()
+    char_predictor.get_backend()
+    cells, expected = synthetic_scan(bank)
+    n_cpu = os.cpu_count() or 1
+    print(f"Synthetic 25-cell scans, {n_cpu} CPUs, glyph cache cleared before each scan")
+    for mode in args.modes.split(","):
+        recognition.RECOGNITION_MODE = mode
+        for workers in sorted({1, 2, 4, n_cpu}):
+            if workers == 1 and mode != "threads":
+                continue            # no pool, same as threads
+            t0 = time.perf_counter()
+            recognition.start_pool(workers)
+            recognition.cell_cache.clear()
+            recognition.recognize_cells_cached(cells, bank, workers=workers)   # template stacks
+            warm = time.perf_counter() - t0
+            times, firsts = [], []
+            for _ in range(args.scans):
+                recognition.glyph_cache.clear()
+                recognition.cell_cache.clear()
+                t0 = time.perf_counter()
+                first = []
+                texts = recognition.recognize_cells_cached(
+                    cells, bank, workers=workers,
+                    on_cell=lambda k, txt: first or first.append(time.perf_counter()))
+                times.append(time.perf_counter() - t0)
+                firsts.append(first[0] - t0)
+            correct = sum(t == e for t, e in zip(texts, expected))
+            print(f"  {mode:<9} {workers:>2} workers: {1000*np.median(times):7.1f} ms/scan "
+                  f"(min {1000*min(times):.1f}, first cell {1000*np.median(firsts):.1f}, "
+                  f"start + first scan {1000*warm:.0f} ms), {correct}/25 cells correct")
+
+
+SHARED_CELL_SIZES = (130, 190, 270, 390, 560)
+
+def bench_shared(args):
+    """
+    Regression check for shared-memory lifetimes in process mode:
+    1) a closed SharedArrays block stays readable through a live view
+    2) scans whose cells need ever bigger scan buffers (more blocks than
+       a worker keeps attached) must not unmap the workers' bank
+    """
+    import gc
+    import recognition
+    import char_predictor
+    from shared_arrays import SharedArrays
+
+    owner = SharedArrays({"a": np.arange(4096, dtype=np.int64)})
+    view = owner.arrays["a"][100:110]
+    owner.close()
+    gc.collect()
+    ok = view.tolist() == list(range(100, 110))
+    print(f"view of a closed block: {'readable' if ok else 'WRONG DATA'}")
+    del view
+
+    bank = recognition.load_templates()
+    char_predictor.get_backend()
+    recognition.RECOGNITION_MODE = "processes"
+    recognition.start_pool(2)
+    failures = 0
+    for rnd in range(args.rounds):
+        for size in SHARED_CELL_SIZES:
+            cells, expected = synthetic_scan(bank, size=size)
+            recognition.cell_cache.clear()
+            recognition.glyph_cache.clear()
+            try:
+                texts = recognition.recognize_cells_cached(cells, bank, workers=2)
+            except Exception as e:
+                failures += 1
+                print(f"  round {rnd} {size}px cells: {type(e).__name__}: {e}")
+                continue
+            correct = sum(t == e for t, e in zip(texts, expected))
+            print(f"  round {rnd} {size}px cells: {correct}/25 correct")
+    print("shared memory check " + ("passed" if ok and not failures
+                                    else f"FAILED ({failures} scans)"))
+
+
+TILE_RESOLUTIONS = {"1080p": (1920, 1080), "1440p": (2560, 1440), "4K": (3840, 2160)}
+
+def synthetic_frame(width, height, seed=0):
+    """
+    A desktop-sized frame with a 5x5 grid of tile-colored squares (white
+    digits on them, colors jittered inside the tolerance) at a random
+    spot, plus tile-colored clutter that must not count as tiles.
+    Returns (frame, expected tile boxes).
+    """
+    from tile_detect import TILE_BGR
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[...] = rng.integers(20, 60, 3, dtype=np.uint8)
+    frame += rng.integers(0, 12, frame.shape, dtype=np.uint8)
+    for _ in range(12):                       # other UI panels
+        x, y = int(rng.integers(0, width - 300)), int(rng.integers(0, height - 200))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(frame, (x, y), (x + int(rng.integers(80, 300)),
+                                      y + int(rng.integers(40, 200))), color, -1)
+    tile = height // 14
+    gap = max(3, tile // 12)
+    gx = int(rng.integers(0, width - 5 * (tile + gap)))
+    gy = int(rng.integers(0, height - 5 * (tile + gap)))
+    boxes = []
+    for i in range(5):
+        for j in range(5):
+            x, y = gx + j * (tile + gap), gy + i * (tile + gap)
+            color = tuple(int(c + rng.integers(-5, 6)) for c in TILE_BGR)
+            cv2.rectangle(frame, (x, y), (x + tile - 1, y + tile - 1), color, -1)
+            cv2.putText(frame, str(rng.integers(0, 256)), (x + tile // 6, y + tile // 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, tile / 90, (255, 255, 255), 2)
+            boxes.append((x, y, tile, tile))
+    # tile-colored but wrong: a bar, a small square, a ring
+    cv2.rectangle(frame, (10, height - 60), (10 + 6 * tile, height - 60 + tile // 3),
+                  TILE_BGR, -1)
+    cv2.rectangle(frame, (width - 40, 10), (width - 20, 30), TILE_BGR, -1)
+    cv2.circle(frame, (width - 3 * tile, height - 3 * tile), tile, TILE_BGR, 6)
+    return frame, sorted(boxes)
+
+def _peak_mb(fn, *args):
+    """(result, seconds, peak MiB of NumPy/Python allocations) for one call"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(*args)
+    dt = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, dt, peak / 2**20
+
+def bench_tiles(args):
+    """Whole-image vs coarse-to-fine tile detection per screen resolution."""
+    from tile_detect import detect_tiles, detect_tiles_full
+
+    print("Tile detection on synthetic frames (peak = NumPy allocations, "
+          "OpenCV buffers not included)")
+    print(f"{'':<7}{'detector':<10}{'median':>10}{'peak':>11}  tiles")
+    detect_tiles(synthetic_frame(640, 480)[0])      # color table, built once
+    for name, (w, h) in TILE_RESOLUTIONS.items():
+        frame, boxes = synthetic_frame(w, h)
+        results = {}
+        for label, fn in (("full", detect_tiles_full), ("coarse", detect_tiles)):
+            times, peak = [], 0.0
+            for _ in range(args.reps):
+                (cands, _), dt, mb = _peak_mb(fn, frame)
+                times.append(dt)
+                peak = max(peak, mb)
+            found = sorted(c[1:5] for c in cands[:25])
+            results[label] = sorted((c[0], c[1:5]) for c in cands)
+            ok = "all 25" if found == boxes else f"{len(set(found) & set(boxes))}/25"
+            print(f"{name:<7}{label:<10}{1000*np.median(times):>8.1f} ms"
+                  f"{peak:>8.1f} MiB  {ok}")
+        same = "same" if results["full"] == results["coarse"] else "DIFFERENT"
+        print(f"{'':<7}{same} candidate list ({len(results['full'])} candidates)")
+
+
+HIGHLIGHT_BGRS = ((165, 71, 0), (167, 78, 1))
+
+def _norm_masks(img):
+    """The pre-color_mask code: tile mask, both highlights ORed, bg binarize"""
+    tile_bgr = np.array([244, 168, 103], dtype=np.int16)
+    diff = np.linalg.norm(img.astype(np.int16) - tile_bgr[None, None, :], axis=2)
+    tile = (diff < 30).astype(np.uint8) * 255
+    hl = np.zeros(img.shape[:2], dtype=np.uint8)
+    for bgr in HIGHLIGHT_BGRS:
+        diff = np.linalg.norm(img.astype(np.int16) - np.array(bgr, dtype=np.int16), axis=2)
+        hl = cv2.bitwise_or(hl, (diff <= 5).astype(np.uint8) * 255)
+    diff = np.linalg.norm(img.astype(np.int16) - tile_bgr, axis=2)
+    fg = np.where(diff > 30, 255, 0).astype(np.uint8)
+    return tile, hl, fg
+
+def _classifier_masks(img):
+    from color_mask import color_classifier
+    tile = color_classifier({"tile": ((244, 168, 103), 30)}).mask(img)
+    hl = color_classifier({f"h{k}": (bgr, 5, True) for k, bgr
+                           in enumerate(HIGHLIGHT_BGRS)}).mask(img)
+    fg = cv2.bitwise_not(color_classifier({"bg": ((244, 168, 103), 30, True)}).mask(img))
+    return tile, hl, fg
+
+def bench_colors(args):
+    """np.linalg.norm masks vs color_mask.ColorClassifier on full frames."""
+    t0 = time.perf_counter()
+    _classifier_masks(np.zeros((1, 1, 3), np.uint8))
+    print(f"Color tables built in {1000*(time.perf_counter()-t0):.0f} ms "
+          "(3 x 16 MiB, once per process)")
+    print("tile mask + highlight mask (2 colors) + background binarize, "
+          "peak = NumPy allocations")
+    for name, (w, h) in TILE_RESOLUTIONS.items():
+        frame, _ = synthetic_frame(w, h)
+        # a highlighted cell's corner marks, so the highlight masks are not empty
+        for k, bgr in enumerate(HIGHLIGHT_BGRS):
+            cv2.circle(frame, (100 + 40 * k, 100), 6, bgr, -1)
+        out = {}
+        for label, fn in (("norm", _norm_masks), ("classifier", _classifier_masks)):
+            times, peak = [], 0.0
+            for _ in range(args.reps):
+                out[label], dt, mb = _peak_mb(fn, frame)
+                times.append(dt)
+                peak = max(peak, mb)
+            print(f"{name:<7}{label:<12}{1000*np.median(times):>8.1f} ms{peak:>8.1f} MiB")
+        same = all(np.array_equal(a, b) for a, b in zip(out["norm"], out["classifier"]))
+        print(f"{'':<7}masks {'identical' if same else 'DIFFERENT'}")
+
+
+class _Shot:
+    """Stands in for an mss ScreenShot: raw BGRA bytearray + array interface."""
+    def __init__(self, bgra):
+        self.height, self.width = bgra.shape[:2]
+        self.raw = bytearray(bgra.tobytes())
+
+    @property
+    def __array_interface__(self):
+        return {"version": 3, "shape": (self.height, self.width, 4),
+                "typestr": "|u1", "data": self.raw}
+
+def _capture_to_warp(img):
+    """_process_scan from the captured frame to the BGR warped grid"""
+    from tile_detect import detect_tiles, warp_grid
+    return warp_grid(img, detect_tiles(img)[0][:25])[0]
+
+def _grab_copy(shot):
+    return np.array(shot)[:, :, :3]           # the pre-zero-copy grab
+
+def _grab_view(shot):
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+def bench_capture(args):
+    """Capture-to-warp memory and time: copied BGR vs BGRA view of the grab."""
+    print("Capture to warped grid (peak = NumPy allocations above the "
+          "screenshot buffer itself)")
+    _capture_to_warp(synthetic_frame(1920, 1080)[0])        # color table
+    for name, (w, h) in TILE_RESOLUTIONS.items():
+        frame, _ = synthetic_frame(w, h)
+        shot = _Shot(cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA))
+        out = {}
+        for label, grab in (("copy", _grab_copy), ("view", _grab_view)):
+            times, peak = [], 0.0
+            for _ in range(args.reps):
+                out[label], dt, mb = _peak_mb(lambda: _capture_to_warp(grab(shot)))
+                times.append(dt)
+                peak = max(peak, mb)
+            print(f"{name:<7}{label:<6}{1000*np.median(times):>8.1f} ms{peak:>8.1f} MiB")
+        same = np.array_equal(out["copy"], out["view"])
+        print(f"{'':<7}warped grids {'identical' if same else 'DIFFERENT'}")
+
+
+def _ppm_bytes(bgr):
+    """What `grim -t ppm` writes for this frame"""
+    h, w = bgr.shape[:2]
+    return f"P6\n{w} {h}\n255\n".encode() + cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB).tobytes()
+
+def bench_grim(args):
+    """
+    grim output handling: PNG encode + imdecode vs PPM parse, full frame
+    and grid-area region. Encoding is cv2's PNG as a stand-in for grim's;
+    with grim on a Wayland session the real commands are timed too.
+    """
+    import shutil
+    from capture import parse_ppm, grim_command
+    print("grim output to BGR array (PNG: encode + decode, PPM: header parse + RGB->BGR)")
+    print(f"{'':<7}{'area':<6}{'png enc':>10}{'png dec':>10}{'ppm':>10}  bytes png/ppm")
+    for name, (w, h) in TILE_RESOLUTIONS.items():
+        frame, boxes = synthetic_frame(w, h)
+        x0, y0 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        x1, y1 = max(b[0] + b[2] for b in boxes), max(b[1] + b[3] for b in boxes)
+        pad = boxes[0][2] // 2            # SCAN_ROI_MARGIN
+        grid = frame[max(0, y0-pad):y1+pad, max(0, x0-pad):x1+pad]
+        for area, img in (("full", frame), ("grid", grid)):
+            enc, dec, ppm = [], [], []
+            for _ in range(args.reps):
+                t0 = time.perf_counter()
+                png = cv2.imencode(".png", img)[1]
+                t1 = time.perf_counter()
+                a = cv2.imdecode(png, cv2.IMREAD_COLOR)
+                t2 = time.perf_counter()
+                data = _ppm_bytes(img)
+                t3 = time.perf_counter()
+                b = cv2.cvtColor(parse_ppm(data), cv2.COLOR_RGB2BGR)
+                t4 = time.perf_counter()
+                enc.append(t1 - t0); dec.append(t2 - t1); ppm.append(t4 - t3)
+            same = "" if np.array_equal(a, b) else "  DIFFERENT"
+            print(f"{name:<7}{area:<6}{1000*np.median(enc):>7.1f} ms{1000*np.median(dec):>7.1f} ms"
+                  f"{1000*np.median(ppm):>7.1f} ms  {png.nbytes/2**20:.1f}/"
+                  f"{len(data)/2**20:.1f} MiB{same}")
+    if not (shutil.which("grim") and os.environ.get("WAYLAND_DISPLAY")):
+        print("grim or a Wayland session not available, skipping live grabs")
+        return
+    for label, cmd, decode in (
+            ("png", ["grim", "-"],
+             lambda out: cv2.imdecode(np.frombuffer(out, np.uint8), cv2.IMREAD_COLOR)),
+            ("ppm", grim_command(),
+             lambda out: cv2.cvtColor(parse_ppm(out), cv2.COLOR_RGB2BGR))):
+        times = []
+        for _ in range(args.reps):
+            t0 = time.perf_counter()
+            img = decode(subprocess.run(cmd, capture_output=True, check=True).stdout)
+            times.append(time.perf_counter() - t0)
+        print(f"live grim {label}: {img.shape[1]}x{img.shape[0]} "
+              f"in {1000*np.median(times):.0f} ms")
+
+
+def _replay_pass(frames):
+    """
+    One pass over `frames` through the app's scan path: capture, tile
+    detection, warp_grid and recognize_cells_cached
+    """
+    import recognition
+    from capture import ReplayCapture
+    from tile_detect import detect_tiles, warp_grid
+    cap = ReplayCapture(frames, loop=False)
+    bank = recognition.load_templates()
+    rows = []
+    for path in cap.frames:
+        t0 = time.perf_counter()
+        img, _ = cap.grab()
+        t1 = time.perf_counter()
+        cands, _ = detect_tiles(img)
+        if len(cands) < 25:
+            rows.append((os.path.basename(path), 1000*(t1-t0), None, None, None))
+            continue
+        _, cells, _ = warp_grid(img, cands[:25])
+        t2 = time.perf_counter()
+        recognition.glyph_cache.clear()
+        recognition.cell_cache.clear()
+        texts = recognition.recognize_cells_cached(cells, bank)
+        t3 = time.perf_counter()
+        rows.append((os.path.basename(path), 1000*(t1-t0), 1000*(t2-t1),
+                     1000*(t3-t2), texts))
+    return rows
+
+def bench_replay(args):
+    """
+    The app's scan path (detect_tiles, warp_grid, recognize_cells_cached)
+    on recorded screenshots (capture.ReplayCapture), twice, to check it
+    is deterministic headless. Without --frames,
+    synthetic frames are written to a temporary directory first.
+    """
+    import tempfile
+    import recognition
+    import char_predictor
+    char_predictor.get_backend()
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = args.frames
+        if not frames:
+            frames = tmp
+            for name, (w, h) in TILE_RESOLUTIONS.items():
+                cv2.imwrite(os.path.join(tmp, f"{name}.png"), synthetic_frame(w, h)[0])
+        recognition.load_templates()
+        passes = [_replay_pass(frames) for _ in range(2)]
+    print(f"{'frame':<24}{'grab':>10}{'tiles+warp':>12}{'recognize':>12}")
+    for name, grab, warp, rec, texts in passes[1]:
+        if texts is None:
+            print(f"{name:<24}{grab:>7.1f} ms  fewer than 25 tiles")
+            continue
+        print(f"{name:<24}{grab:>7.1f} ms{warp:>9.1f} ms{rec:>9.1f} ms")
+    same = [r[4] for r in passes[0]] == [r[4] for r in passes[1]]
+    print(f"recognized texts {'identical' if same else 'DIFFERENT'} across passes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ncc", help="batched vs per-template NCC matcher")
+    p.add_argument("--glyphs", type=int, default=100)
+    p.set_defaults(fn=bench_ncc)
+
+    p = sub.add_parser("canonical", help="canonical-box vs resize-the-template accuracy")
+    p.set_defaults(fn=bench_canonical)
+
+    p = sub.add_parser("bits", help="bit-packed popcount matcher: memory, speed, accuracy")
+    p.set_defaults(fn=bench_bits)
+
+    p = sub.add_parser("index", help="candidate pruning: accuracy and pruning ratio per k")
+    p.add_argument("--mode", default="resize", choices=["resize", "canonical", "bits"])
+    p.set_defaults(fn=bench_index)
+
+    p = sub.add_parser("medoids", help="accuracy vs latency per medoids-per-label k")
+    p.add_argument("--mode", default="resize", choices=["resize", "canonical", "bits"])
+    p.add_argument("--folds", type=int, default=5)
+    p.set_defaults(fn=bench_medoids)
+
+    p = sub.add_parser("nn", help="NN backends: cold start, memory, batch latency")
+    p.add_argument("--backends", default="keras,onnx,numpy")
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(fn=bench_nn)
+
+    p = sub.add_parser("cascade", help="recognition cascade: accuracy and hit rate per stage order")
+    p.add_argument("--folds", type=int, default=5)
+    p.add_argument("--orders", default=CASCADE_ORDERS,
+                   help="';'-separated stage orders, stages ','-separated")
+    p.set_defaults(fn=bench_cascade)
+
+    p = sub.add_parser("workers", help="scan wall-clock per recognition worker count")
+    p.add_argument("--scans", type=int, default=5)
+    p.add_argument("--modes", default="threads,processes")
+    p.set_defaults(fn=bench_workers)
+
+    p = sub.add_parser("shared", help="process mode: shared-memory lifetime regression check")
+    p.add_argument("--rounds", type=int, default=2)
+    p.set_defaults(fn=bench_shared)
+
+    p = sub.add_parser("tiles", help="tile detector: full image vs coarse-to-fine")
+    p.add_argument("--reps", type=int, default=5)
+    p.set_defaults(fn=bench_tiles)
+
+    p = sub.add_parser("capture", help="capture-to-warp: copied BGR vs zero-copy BGRA")
+    p.add_argument("--reps", type=int, default=3)
+    p.set_defaults(fn=bench_capture)
+
+    p = sub.add_parser("grim", help="Wayland grabs: grim PNG vs raw PPM output, full and region")
+    p.add_argument("--reps", type=int, default=3)
+    p.set_defaults(fn=bench_grim)
+
+    p = sub.add_parser("replay", help="scan pipeline on recorded screenshots (replay capture)")
+    p.add_argument("--frames", help="screenshot file or directory (default: synthetic)")
+    p.set_defaults(fn=bench_replay)
+
+    p = sub.add_parser("colors", help="color masks: np.linalg.norm vs lookup-table classifier")
+    p.add_argument("--reps", type=int, default=3)
+    p.set_defaults(fn=bench_colors)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+if __name__ == "__main__":
+    main()
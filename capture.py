@@ -0,0 +1,212 @@
+# capture.py
+# Screen capture backends: a persistent mss session (X11/Windows), grim
+# (Wayland) and replay of recorded screenshots for headless runs.
+# grim is asked for binary PPM instead of PNG, so a grab is a pipe read
+# plus one RGB->BGR pass instead of a full-desktop PNG encode and decode.
+import os
+import platform
+import subprocess
+import threading
+import numpy as np
+import cv2
+
+
+def parse_ppm(data):
+    """
+    (H, W, 3) RGB view of a binary (P6, 8-bit) PPM held in `data`,
+    no copy. Header comments are allowed.
+    """
+    buf = memoryview(data)
+    fields, pos = [], 2
+    if bytes(buf[:2]) != b"P6":
+        raise ValueError("not a binary PPM (P6)")
+    while len(fields) < 3:
+        # whitespace and "#..." comments between the header fields
+        while pos < len(buf) and (chr(buf[pos]).isspace() or buf[pos] == ord("#")):
+            if buf[pos] == ord("#"):
+                while pos < len(buf) and buf[pos] != ord("\n"):
+                    pos += 1
+            pos += 1
+        start = pos
+        while pos < len(buf) and chr(buf[pos]).isdigit():
+            pos += 1
+        if start == pos:
+            raise ValueError("truncated PPM header")
+        fields.append(int(bytes(buf[start:pos])))
+    w, h, maxval = fields
+    if maxval != 255:
+        raise ValueError(f"unsupported PPM maxval {maxval}")
+    pos += 1                       # the single whitespace before the pixels
+    if len(buf) - pos < w * h * 3:
+        raise ValueError("truncated PPM data")
+    return np.frombuffer(data, dtype=np.uint8, count=w * h * 3,
+                         offset=pos).reshape(h, w, 3)
+
+def grim_command(region=None):
+    """grim argv for a PPM of `region` (mss-style dict) or of all outputs"""
+    cmd = ["grim", "-t", "ppm"]
+    if region:
+        cmd += ["-g", f"{region['left']},{region['top']} "
+                      f"{region['width']}x{region['height']}"]
+    return cmd + ["-"]
+
+def grim_grab(region=None):
+    """BGR screenshot of `region` (or everything) from grim; raises on failure"""
+    p = subprocess.run(grim_command(region), capture_output=True, check=True)
+    return cv2.cvtColor(parse_ppm(p.stdout), cv2.COLOR_RGB2BGR)
+
+
+# Backends. Each has grab(region=None) -> (image, (left, top) of its first
+# pixel), screen() -> the full-screen rectangle once known (mss-style
+# dict) or None, and close(). `live` is False when the frames are not the
+# current screen, so callers skip hiding or blacking out their windows.
+# `regions` is False once region grabs are known not to share the full
+# grab's pixel coordinates; callers then stick to full grabs.
+CAPTURE_BACKEND = os.environ.get("HPSOLVER_CAPTURE", "")   # mss | grim | replay:<path>
+REPLAY_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm")
+
+
+class MssCapture:
+    """
+    X11/Windows/macOS via mss, one session per thread kept open for the
+    life of the app (mss sessions must not be shared between threads).
+    Images are BGRA views over the grab's own buffer.
+    """
+    name, live, regions = "mss", True, True
+
+    def __init__(self):
+        import mss                    # only needed off Wayland
+        self._mss = mss
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _session(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = self._mss.mss()
+            with self._lock:
+                self._sessions.append(sct)
+        return sct
+
+    def screen(self):
+        return dict(self._session().monitors[0])
+
+    def grab(self, region=None):
+        sct = self._session()
+        mon = region or sct.monitors[0]
+        shot = sct.grab(mon)
+        img = np.frombuffer(shot.raw, dtype=np.uint8).reshape(
+            shot.height, shot.width, 4)
+        return img, (mon["left"], mon["top"])
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for sct in sessions:
+            try:
+                sct.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+class GrimCapture:
+    """
+    Wayland via grim's raw PPM output (see grim_grab). BGR images.
+    Full grabs come out at the output scale, but -g takes compositor
+    (logical) coordinates, so on a scaled output a region from a full
+    grab names the wrong area. That shows as a region grab whose size
+    is not the one asked for: the grab fails and `regions` goes False.
+    """
+    name, live = "grim", True
+
+    def __init__(self):
+        self._screen = None
+        self.regions = True
+
+    def screen(self):
+        return self._screen
+
+    def grab(self, region=None):
+        img = grim_grab(region)
+        if region is None:
+            h, w = img.shape[:2]
+            self._screen = {"left": 0, "top": 0, "width": w, "height": h}
+            return img, (0, 0)
+        if img.shape[:2] != (region["height"], region["width"]):
+            self.regions = False
+            raise ValueError(f"grim returned {img.shape[1]}x{img.shape[0]} for a "
+                             f"{region['width']}x{region['height']} region (scaled "
+                             "output?); using full grabs from now on")
+        return img, (region["left"], region["top"])
+
+    def close(self):
+        pass
+
+
+class ReplayCapture:
+    """
+    Recorded screenshots instead of the screen: one image file, or every
+    image in a directory in name order. Each grab reads the next frame
+    from disk (full or region grab alike, one grab = one scan); regions
+    are cut out of it, clipped to the frame. After the last frame it
+    starts over, or raises EOFError with loop=False.
+    """
+    name, live, regions = "replay", False, True
+
+    def __init__(self, path, loop=True):
+        if os.path.isdir(path):
+            self.frames = sorted(os.path.join(path, f) for f in os.listdir(path)
+                                 if f.lower().endswith(REPLAY_EXTS))
+        else:
+            self.frames = [path]
+        if not self.frames:
+            raise FileNotFoundError(f"No images to replay in {path}")
+        self.loop = loop
+        self.index = 0
+        self._screen = None
+
+    def screen(self):
+        return self._screen
+
+    def grab(self, region=None):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                raise EOFError("replay: no frames left")
+            self.index = 0
+        path = self.frames[self.index]
+        self.index += 1
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"replay: cannot read {path}")
+        h, w = img.shape[:2]
+        self._screen = {"left": 0, "top": 0, "width": w, "height": h}
+        if region is None:
+            return img, (0, 0)
+        x0, y0 = max(region["left"], 0), max(region["top"], 0)
+        x1 = min(region["left"] + region["width"], w)
+        y1 = min(region["top"] + region["height"], h)
+        return img[y0:max(y0, y1), x0:max(x0, x1)], (x0, y0)
+
+    def close(self):
+        pass
+
+
+def open_capture(spec=None):
+    """
+    Backend for `spec` ("mss", "grim", "replay:<file or dir>"), by
+    default HPSOLVER_CAPTURE, else grim on Wayland and mss elsewhere.
+    """
+    spec = spec or CAPTURE_BACKEND
+    if not spec:
+        wayland = (platform.system() == "Linux"
+                   and bool(os.environ.get("WAYLAND_DISPLAY")))
+        spec = "grim" if wayland else "mss"
+    if spec == "mss":
+        return MssCapture()
+    if spec == "grim":
+        return GrimCapture()
+    if spec.startswith("replay:"):
+        return ReplayCapture(spec[len("replay:"):])
+    raise ValueError(f"Unknown capture backend: {spec!r}")
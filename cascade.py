@@ -0,0 +1,205 @@
+# cascade.py
+# Confidence-gated glyph recognition: each stage labels the glyphs the
+# earlier stages were not sure about, cheapest first.
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from template_bank import match_template_ncc_improved
+
+# stage name → confidence a label needs before the cascade stops there
+DEFAULT_THRESHOLDS = {
+    "cache": 0.0,          # a past decision, always taken
+    "templates": 0.65,     # pruned template scan (ncc_thresh)
+    "full": 0.65,          # every template, catches what pruning dropped
+    "nn": 0.7,             # softmax probability
+}
+# cache → pruned templates → every template → NN: pruning costs no
+# accuracy, and only glyphs no template clears reach the NN. The app's
+# recognition.CASCADE_ORDER defaults to this.
+DEFAULT_ORDER = ("cache", "templates", "full", "nn")
+
+
+class Stage:
+    """
+    run(masks, bank, pool) → [(label, confidence), ...], label None for
+    "no idea". Confidences are in [0, 1] so one threshold scale fits every
+    stage. pool is an optional executor for per-glyph work.
+    """
+    name = "stage"
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.reset_stats()
+
+    def ready(self):
+        return True
+
+    def available(self):
+        """False when the stage can never run (e.g. its model failed)"""
+        return True
+
+    def run(self, masks, bank, pool=None):
+        raise NotImplementedError
+
+    def reset_stats(self):
+        self.seen = self.hits = self.skipped = 0
+        self.seconds = 0.0
+
+    def cost_ms(self):
+        """Measured ms per glyph this stage looked at."""
+        return 1000 * self.seconds / self.seen if self.seen else 0.0
+
+
+class CacheStage(Stage):
+    name = "cache"
+
+    def __init__(self, cache, threshold=DEFAULT_THRESHOLDS["cache"]):
+        super().__init__(threshold)
+        self.cache = cache
+
+    def run(self, masks, bank, pool=None):
+        out = []
+        for m in masks:
+            hit = self.cache.get(m)
+            out.append((hit[0], 1.0) if hit is not None else (None, 0.0))
+        return out
+
+
+def match_glyph(mask, bank, prune_k=None):
+    """
+    Module-level so process pools can pickle it; with a
+    template_bank.SharedTemplateBank only the block name crosses over.
+    """
+    lbl, score = match_template_ncc_improved(mask, bank, ncc_thresh=-1.0,
+                                             prune_k=prune_k)
+    return (lbl, min(max(score, 0.0), 1.0)) if lbl else (None, 0.0)
+
+
+class TemplateStage(Stage):
+    """prune_k=None → template_bank.PRUNE_K candidates, 0 → every template"""
+
+    def __init__(self, name, threshold, prune_k=None):
+        super().__init__(threshold)
+        self.name = name
+        self.prune_k = prune_k
+
+    def run(self, masks, bank, pool=None):
+        if pool is None:
+            return [match_glyph(m, bank, self.prune_k) for m in masks]
+        match = partial(match_glyph, bank=bank, prune_k=self.prune_k)
+        if isinstance(pool, ProcessPoolExecutor):
+            # one round trip per worker rather than per glyph
+            workers = pool._max_workers
+            return list(pool.map(match, masks,
+                                 chunksize=max(1, -(-len(masks) // workers))))
+        return list(pool.map(match, masks))
+
+
+class NNStage(Stage):
+    """
+    One batched predict call per run; skipped while the model loads and
+    left out altogether if it failed to load.
+    """
+    name = "nn"
+
+    def __init__(self, predict_batch, is_ready=lambda: True,
+                 threshold=DEFAULT_THRESHOLDS["nn"], is_failed=lambda: False):
+        super().__init__(threshold)
+        self.predict_batch = predict_batch
+        self.is_ready = is_ready
+        self.is_failed = is_failed
+
+    def ready(self):
+        return self.is_ready()
+
+    def available(self):
+        return not self.is_failed()
+
+    def run(self, masks, bank, pool=None):
+        return self.predict_batch(masks)
+
+
+class Cascade:
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.unresolved = 0
+
+    def classify(self, masks, bank, only=None, pool=None, hold=(), start=None):
+        """
+        Returns (labels, confidences, stage names, deferred).
+        A glyph gets None when no stage cleared its threshold; `deferred`
+        holds the indices of those that skipped a stage which wasn't
+        ready, so classify(..., only=[that stage]) can finish them later.
+        Glyphs that reach a stage in `hold` stop there and are deferred
+        too, later stages untouched; classify(..., start=that stage)
+        picks them up in order (the NN, batched over many calls).
+        """
+        n = len(masks)
+        labels, confs, by = [None] * n, [0.0] * n, [None] * n
+        todo, skipped = list(range(n)), set()
+        started = start is None
+        for st in self.stages:
+            started = started or st.name == start
+            if not todo:
+                break
+            if not started or (only is not None and st.name not in only):
+                continue
+            if not st.available():
+                continue
+            if st.name in hold:
+                skipped.update(todo)
+                break
+            if not st.ready():
+                st.skipped += len(todo)
+                skipped.update(todo)
+                continue
+            t0 = time.perf_counter()
+            out = st.run([masks[k] for k in todo], bank, pool)
+            st.seconds += time.perf_counter() - t0
+            st.seen += len(todo)
+            rest = []
+            for k, (lbl, conf) in zip(todo, out):
+                if lbl is not None and conf >= st.threshold:
+                    labels[k], confs[k], by[k] = lbl, conf, st.name
+                    st.hits += 1
+                else:
+                    rest.append(k)
+            todo = rest
+        deferred = [k for k in todo if k in skipped]
+        self.unresolved += len(todo) - len(deferred)
+        return labels, confs, by, deferred
+
+    def reset_stats(self):
+        self.unresolved = 0
+        for st in self.stages:
+            st.reset_stats()
+
+    def report(self):
+        parts = []
+        for st in self.stages:
+            rate = 100 * st.hits / st.seen if st.seen else 0.0
+            part = f"{st.name} {st.hits}/{st.seen} ({rate:.0f}%, {st.cost_ms():.2f} ms)"
+            if st.skipped:
+                part += f" {st.skipped} skipped"
+            parts.append(part)
+        return f"Cascade: {' → '.join(parts)}, {self.unresolved} unresolved"
+
+
+def build_cascade(order=DEFAULT_ORDER, thresholds=None, cache=None,
+                  predict_batch=None, nn_ready=lambda: True,
+                  nn_failed=lambda: False):
+    """Stages by name; 'cache' needs cache=, 'nn' needs predict_batch=."""
+    th = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    stages = []
+    for name in order:
+        if name == "cache":
+            stages.append(CacheStage(cache, th["cache"]))
+        elif name == "templates":
+            stages.append(TemplateStage("templates", th["templates"]))
+        elif name == "full":
+            stages.append(TemplateStage("full", th["full"], prune_k=0))
+        elif name == "nn":
+            stages.append(NNStage(predict_batch, nn_ready, th["nn"], nn_failed))
+        else:
+            raise ValueError(f"Unknown cascade stage: {name!r}")
+    return Cascade(stages)
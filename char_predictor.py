@@ -1,15 +1,211 @@
 # char_predictor.py
-from tensorflow import keras
+import os
+import time
+import threading
+import importlib.util
 import numpy as np
-from PIL import Image
+import cv2
 
 LABELS = "0123456789!@#$%^&*()@%"
-model = keras.models.load_model("char_cnn.keras")
+INPUT_SIZE = 32
+KERAS_FILE = "char_cnn.keras"
+ONNX_FILE = "char_cnn.onnx"          # written by export_onnx.py
+ONNX_INT8_FILE = "char_cnn_int8.onnx"   # written by quantize_model.py
+WEIGHTS_FILE = "char_cnn_weights.npz"   # written by export_numpy.py
+# "auto" picks the first of onnx → numpy → keras whose model file exists
+# (and runtime is installed), so TensorFlow is only imported as a last resort
+# and numpy + OpenCV alone are enough when char_cnn_weights.npz is present.
+# "onnx-int8" must be asked for explicitly, see quantize_model.py.
+BACKEND = os.environ.get("HPSOLVER_NN_BACKEND", "auto")
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, path=KERAS_FILE):
+        from tensorflow import keras
+        self.model = keras.models.load_model(path)
+
+    def __call__(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path=ONNX_FILE, name="onnx"):
+        import onnxruntime as ort
+        self.name = name
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def _conv(x, w, b):
+    """
+    Stride-1 'valid' convolution as im2col + one matmul.
+    x: (N, H, W, C), w: (kh, kw, C, F) → (N, H-kh+1, W-kw+1, F)
+    """
+    kh, kw, c, f = w.shape
+    n, h, wd, _ = x.shape
+    oh, ow = h - kh + 1, wd - kw + 1
+    s0, s1, s2, s3 = x.strides
+    # (N, oh, ow, kh, kw, C) view over x, flattened in Keras' kernel order
+    cols = np.lib.stride_tricks.as_strided(
+        x, shape=(n, oh, ow, kh, kw, c), strides=(s0, s1, s2, s1, s2, s3))
+    cols = cols.reshape(n * oh * ow, kh * kw * c)
+    out = cols @ w.reshape(kh * kw * c, f)
+    out += b
+    return out.reshape(n, oh, ow, f)
+
+def _pool(x):
+    """2x2 max pooling, stride 2, odd edges dropped like Keras 'valid'"""
+    h2, w2 = x.shape[1] // 2 * 2, x.shape[2] // 2 * 2
+    top = np.maximum(x[:, 0:h2:2, 0:w2:2], x[:, 0:h2:2, 1:w2:2])
+    bottom = np.maximum(x[:, 1:h2:2, 0:w2:2], x[:, 1:h2:2, 1:w2:2])
+    return np.maximum(top, bottom, out=top)
+
+def _softmax(z):
+    z = np.exp(z - z.max(axis=1, keepdims=True))
+    return z / z.sum(axis=1, keepdims=True)
+
+
+class NumpyBackend:
+    """The Sequential model from train_char_cnn.py, evaluated with NumPy only."""
+    name = "numpy"
+
+    def __init__(self, path=WEIGHTS_FILE):
+        with np.load(path) as data:
+            self.layers = [(str(op), data.get(f"w{k}"), data.get(f"b{k}"))
+                           for k, op in enumerate(data["ops"])]
+
+    def __call__(self, batch):
+        x = np.ascontiguousarray(batch, dtype=np.float32)
+        for op, w, b in self.layers:
+            if op == "pool":
+                x = _pool(x)
+                continue
+            if op == "flatten":
+                x = x.reshape(len(x), -1)
+                continue
+            kind, act = op.split("_")
+            if kind == "conv":
+                x = _conv(x, w, b)
+            else:
+                x = x @ w
+                x += b
+            if act == "relu":
+                np.maximum(x, 0, out=x)
+            elif act == "softmax":
+                x = _softmax(x)
+        return x
+
+
+def load_backend(name=BACKEND):
+    if name == "auto":
+        if importlib.util.find_spec("onnxruntime") and os.path.exists(ONNX_FILE):
+            name = "onnx"
+        elif os.path.exists(WEIGHTS_FILE):
+            name = "numpy"
+        else:
+            name = "keras"
+    if name == "numpy":
+        return NumpyBackend()
+    if name == "onnx":
+        return OnnxBackend()
+    if name == "onnx-int8":
+        return OnnxBackend(ONNX_INT8_FILE, name)
+    if name == "keras":
+        return KerasBackend()
+    raise ValueError(f"Unknown NN backend: {name!r}")
+
+# The model is loaded on first use or by start_loading(), never at import,
+# so importing this module costs nothing.
+backend = None
+status = "idle"                 # idle → loading → ready | failed
+_ready = threading.Event()
+_state_lock = threading.Lock()
+_callbacks = []
+
+def _load(name):
+    global backend, status
+    t0 = time.perf_counter()
+    try:
+        loaded = load_backend(name)
+        print(f"Character CNN: {loaded.name} backend loaded in {time.perf_counter()-t0:.2f} s")
+    except Exception as e:
+        loaded = None
+        print(f"Character CNN failed to load: {e}")
+    with _state_lock:
+        backend = loaded
+        status = "ready" if loaded is not None else "failed"
+        callbacks = _callbacks[:]
+        _callbacks.clear()
+    _ready.set()
+    for cb in callbacks:
+        cb()
+
+def start_loading(name=BACKEND):
+    """Load the model on a daemon thread; returns immediately."""
+    global status
+    with _state_lock:
+        if status != "idle":
+            return
+        status = "loading"
+    threading.Thread(target=_load, args=(name,), daemon=True).start()
+
+def is_ready():
+    return status == "ready"
+
+def is_failed():
+    """True once loading has failed; the NN stage is then left out."""
+    return status == "failed"
+
+def when_ready(callback):
+    """
+    Run callback() once loading has finished: right away if it already
+    has, otherwise on the loader thread. Also called when loading fails
+    (is_failed() then tells), so queued work is never left hanging.
+    """
+    start_loading()
+    with _state_lock:
+        if status == "loading":
+            _callbacks.append(callback)
+            return
+    callback()
+
+def get_backend():
+    """The loaded backend, waiting for (or starting) the load if needed."""
+    start_loading()
+    _ready.wait()
+    if backend is None:
+        raise RuntimeError("character CNN is not available")
+    return backend
+
+def preprocess(masks):
+    """
+    List of 2D uint8 glyph masks (any sizes) → (N, 32, 32, 1) float32 in [0, 1].
+    INTER_NEAREST_EXACT samples pixel centers like the PIL NEAREST resize
+    the model was trained with.
+    """
+    batch = np.empty((len(masks), INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+    for k, img_arr in enumerate(masks):
+        batch[k] = cv2.resize(img_arr, (INPUT_SIZE, INPUT_SIZE),
+                              interpolation=cv2.INTER_NEAREST_EXACT)
+    batch *= 1.0 / 255.0
+    return batch[..., None]
+
+def predict_chars(masks):
+    """One forward pass for all glyphs → [(label, confidence), ...]"""
+    if not len(masks):
+        return []
+    pred = get_backend()(preprocess(masks))
+    idx = np.argmax(pred, axis=1)
+    conf = pred[np.arange(len(idx)), idx]
+    return [(LABELS[i], float(c)) for i, c in zip(idx, conf)]
 
 def predict_char(img_arr):
     # img_arr: 2D numpy array, shape (H, W), values 0-255
-    arr = np.array(Image.fromarray(img_arr).resize((32,32), Image.NEAREST)) / 255.0
-    arr = arr[None, ..., None]  # shape (1, 32, 32, 1)
-    pred = model.predict(arr)
-    idx = np.argmax(pred)
-    return LABELS[idx], float(np.max(pred))
+    return predict_chars([img_arr])[0]
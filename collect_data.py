@@ -1,13 +1,14 @@
 import os
 import platform
-import subprocess
-import mss
 import numpy as np
 import cv2
 import tkinter as tk
 from tkinter import messagebox
 import re
 import time
+from color_mask import color_classifier, to_bgr
+from tile_detect import detect_tiles
+from capture import open_capture
 
 ALL_CHARS_DIR = "all_chars"
 DEBUG_DIR = "debug"
@@ -31,24 +32,14 @@ def get_next_char_idx(char_dir):
                 max_idx = idx
     return max_idx + 1
 
+capturer = open_capture()
+
 def grab_full_screen():
-    if IS_WAYLAND:
-        try:
-            p = subprocess.run(["grim", "-"], capture_output=True, check=True)
-            arr = np.frombuffer(p.stdout, dtype=np.uint8)
-            return cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        except Exception as e:
-            print("Wayland grab failed (need grim?):", e)
-            return None
-    else:
-        try:
-            with mss.mss() as sct:
-                mon = sct.monitors[0]
-                shot = sct.grab(mon)
-            return np.array(shot)[:, :, :3]
-        except Exception as e:
-            print("mss grab failed:", e)
-            return None
+    try:
+        return to_bgr(capturer.grab()[0])
+    except Exception as e:
+        print(f"{capturer.name} grab failed:", e)
+        return None
 
 def merge_boxes(pads, x_thresh=10, y_thresh=12):
     """
@@ -176,10 +167,9 @@ def binarize_by_bgcolor(char_img, bg_bgr=(244,168,103), threshold=30):
     # char_img: BGR or grayscale
     if len(char_img.shape) == 2:
         char_img = cv2.cvtColor(char_img, cv2.COLOR_GRAY2BGR)
-    diff = np.linalg.norm(char_img.astype(np.int16) - np.array(bg_bgr, dtype=np.int16), axis=2)
-    # Foreground: pixels far from background color
-    bin_img = np.where(diff > threshold, 255, 0).astype(np.uint8)
-    return bin_img
+    # Foreground: pixels far from background color (color_mask.py)
+    bg = color_classifier({"bg": (bg_bgr, threshold, True)}).mask(char_img)
+    return cv2.bitwise_not(bg)
 
 def take_and_dump_chars():
     # Hide all windows (add your actual window objects to windows_to_hide)
@@ -195,28 +185,10 @@ def take_and_dump_chars():
         messagebox.showerror("Error", "Could not capture screen.")
         return
 
-    # --- Tile detection (copy from your main pipeline) ---
-    tile_bgr = np.array([244,168,103], dtype=np.int16)
-    diff = np.linalg.norm(img.astype(np.int16) - tile_bgr[None,None,:], axis=2)
-    tile_mask = (diff < 30).astype(np.uint8) * 255
+    # --- Tile detection (same detector as the main pipeline) ---
+    cands, tile_mask = detect_tiles(img)
     cv2.imwrite(os.path.join(DEBUG_DIR, "tile_mask.png"), tile_mask)
 
-    cnts,_ = cv2.findContours(tile_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    cands = []
-    for cnt in cnts:
-        area = cv2.contourArea(cnt)
-        if area < 2000:
-            continue
-        peri = cv2.arcLength(cnt, True)
-        approx = cv2.approxPolyDP(cnt, 0.02*peri, True)
-        if len(approx) != 4:
-            continue
-        x,y,ww,hh = cv2.boundingRect(approx)
-        ar = ww/float(hh) if hh>0 else 0
-        if not 0.7<ar<1.3:
-            continue
-        cands.append((area, x,y,ww,hh, approx))
-    cands.sort(key=lambda t: t[0], reverse=True)
     if len(cands) < 25:
         messagebox.showerror("Error", f"Only {len(cands)} tiles found, aborting.")
         return
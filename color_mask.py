@@ -0,0 +1,110 @@
+# color_mask.py
+# Per-pixel color classification against a handful of target colors in
+# one pass: a 2^24-entry table (one bit per target) indexed by the packed
+# BGR value, applied a strip of rows at a time.
+import math
+import threading
+from functools import lru_cache
+import numpy as np
+import cv2
+
+STRIP_ROWS = 64      # rows per strip; bounds the int32 index temporaries
+
+
+class ColorClassifier:
+    """
+    targets: {name: (bgr, tol)} or {name: (bgr, tol, inclusive)}.
+    A pixel matches a target when its Euclidean BGR distance is < tol
+    (<= tol when inclusive), i.e. exactly
+    np.linalg.norm(img - bgr, axis=2) < tol, but on integers and without
+    the float64 temporaries. Up to 8 targets; the 16 MiB table is built
+    on first use.
+    """
+    def __init__(self, targets):
+        if not 0 < len(targets) <= 8:
+            raise ValueError("ColorClassifier takes 1 to 8 target colors")
+        self.names = list(targets)
+        self.targets = dict(targets)
+        self._lut = None
+        self._lock = threading.Lock()
+
+    def bit(self, *names):
+        b = 0
+        for name in names:
+            b |= 1 << self.names.index(name)
+        return b
+
+    def lut(self):
+        """uint8[r, g, b] → bit k set when (b, g, r) matches target k"""
+        if self._lut is None:
+            with self._lock:
+                if self._lut is None:
+                    self._lut = self._build()
+        return self._lut
+
+    def _build(self):
+        lut = np.zeros((256, 256, 256), dtype=np.uint8)
+        v = np.arange(256, dtype=np.int32)
+        for k, name in enumerate(self.names):
+            bgr, tol, *inclusive = self.targets[name]
+            # largest squared integer distance that still matches
+            limit = (math.floor(tol * tol) if inclusive and inclusive[0]
+                     else math.ceil(tol * tol) - 1)
+            sb, sg, sr = ((v - c) ** 2 for c in bgr)
+            for r0 in range(0, 256, 32):
+                d = sr[r0:r0+32, None, None] + sg[None, :, None] + sb[None, None, :]
+                lut[r0:r0+32][d <= limit] |= 1 << k
+        return lut.reshape(-1)
+
+    def labels(self, img):
+        """
+        (H, W) uint8 bit field for a BGR or BGRA uint8 image (any row
+        stride; BGRA is read in place).
+        """
+        lut = self.lut()
+        if img.strides[-1] != 1 or img.strides[-2] != img.shape[-1]:
+            img = np.ascontiguousarray(img)      # e.g. img[::4, ::4]
+        h, w = img.shape[:2]
+        out = np.empty((h, w), dtype=np.uint8)
+        for y in range(0, h, STRIP_ROWS):
+            strip = img[y:y+STRIP_ROWS]
+            if strip.shape[2] == 3:
+                strip = cv2.cvtColor(strip, cv2.COLOR_BGR2BGRA)
+            # little-endian BGRA pixel as uint32 = b | g<<8 | r<<16 | a<<24
+            idx = strip.view(np.uint32)[..., 0] & 0xFFFFFF
+            np.take(lut, idx, out=out[y:y+STRIP_ROWS])
+        return out
+
+    def mask(self, img, *names):
+        """255 where a pixel matches any of `names` (all targets if none)"""
+        labels = self.labels(img)
+        bit = self.bit(*names) if names else (1 << len(self.names)) - 1
+        if bit != 0xFF:
+            np.bitwise_and(labels, bit, out=labels)
+        return cv2.threshold(labels, 0, 255, cv2.THRESH_BINARY)[1]
+
+    def masks(self, img):
+        """{name: 0/255 mask} for every target from one labeling pass"""
+        labels = self.labels(img)
+        return {name: cv2.threshold(np.bitwise_and(labels, 1 << k), 0, 255,
+                                    cv2.THRESH_BINARY)[1]
+                for k, name in enumerate(self.names)}
+
+
+def to_bgr(img, copy=False):
+    """
+    3-channel BGR for a BGR or BGRA image. BGR input comes back as is
+    (copied if copy=True), BGRA is converted, which always copies.
+    """
+    if img.ndim == 3 and img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img.copy() if copy else img
+
+
+@lru_cache(maxsize=4)
+def _classifier(items):
+    return ColorClassifier(dict(items))
+
+def color_classifier(targets):
+    """Shared ColorClassifier per target set, so tables are built once."""
+    return _classifier(tuple(targets.items()))
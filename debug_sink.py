@@ -0,0 +1,126 @@
+# debug_sink.py
+# Debug images written off the scan path: callers hand arrays to the sink,
+# a background thread PNG-encodes them into debug/<scan>/ directories and
+# only the newest few scans are kept.
+import os
+import re
+import time
+import queue
+import shutil
+import threading
+import cv2
+
+DEBUG_DIR = os.path.join(os.path.abspath("."), "debug")
+# "off": nothing is written (and callers skip drawing their overlays),
+# "summary": screenshot, tile overlay, warped grid, corner overlays,
+# "full": every mask and crop down to the per-glyph dumps.
+LEVELS = {"off": 0, "summary": 1, "full": 2}
+DEBUG_LEVEL = os.environ.get("HPSOLVER_DEBUG", "off")
+DEBUG_KEEP_SCANS = 10         # newest scan directories kept on disk
+DEBUG_QUEUE_SIZE = 64         # images waiting for the writer; more are dropped
+
+_SCAN_DIR_RE = re.compile(r"^\d{8}-\d{6}-\d{4}-")
+
+
+class DebugSink:
+    """
+    new_scan() starts a directory, save(name, img, level) queues an image
+    for it. The sink keeps a reference to img until it is written, so
+    callers must not draw on it afterwards.
+    """
+    def __init__(self, level=DEBUG_LEVEL, root=DEBUG_DIR,
+                 keep=DEBUG_KEEP_SCANS, queue_size=DEBUG_QUEUE_SIZE):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown debug level: {level!r}")
+        self.level = level
+        self.root = root
+        self.keep = keep
+        self.scan_dir = None
+        self.written = self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._writer_pid = None
+
+    def enabled(self, level="summary"):
+        return LEVELS[self.level] >= LEVELS[level]
+
+    def new_scan(self, tag="scan"):
+        """Start debug/<time>-<n>-<tag>/; older scans beyond `keep` go."""
+        if not self.enabled():
+            self.scan_dir = None
+            return None
+        with self._lock:
+            self._seq = (self._seq + 1) % 10000
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._seq:04d}-{tag}"
+        self.scan_dir = os.path.join(self.root, name)
+        self._put((self._rotate, (self.scan_dir,)))
+        return self.scan_dir
+
+    def path(self, name):
+        """Path inside the current scan directory (None when off)."""
+        return os.path.join(self.scan_dir, name) if self.scan_dir else None
+
+    def save(self, name, img, level="summary"):
+        """Queue img as <scan dir>/<name> if level is enabled."""
+        if self.scan_dir and self.enabled(level):
+            self.imwrite(os.path.join(self.scan_dir, name), img)
+
+    def imwrite(self, path, img):
+        """Queue img for path unconditionally (callers gate on enabled)."""
+        self._put((self._write, (path, img)))
+
+    def flush(self):
+        """Wait until everything queued so far is on disk."""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def report(self):
+        return (f"Debug sink ({self.level}): {self.written} written, "
+                f"{self.dropped} dropped, {self._queue.qsize()} queued")
+
+    def _put(self, job):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        # per process: a forked recognition worker gets its own writer
+        pid = os.getpid()
+        if self._writer_pid == pid:
+            return
+        with self._lock:
+            if self._writer_pid != pid:
+                if self._writer_pid is not None:
+                    self._queue = queue.Queue(self._queue.maxsize)
+                threading.Thread(target=self._run, daemon=True,
+                                 name="debug-writer").start()
+                self._writer_pid = pid
+
+    def _run(self):
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Debug sink: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path, img):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, img)
+        self.written += 1
+
+    def _rotate(self, scan_dir):
+        os.makedirs(scan_dir, exist_ok=True)
+        scans = sorted(d for d in os.listdir(self.root)
+                       if _SCAN_DIR_RE.match(d)
+                       and os.path.isdir(os.path.join(self.root, d)))
+        for d in scans[:max(0, len(scans) - self.keep)]:
+            shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+
+
+sink = DebugSink()
@@ -0,0 +1,50 @@
+# export_numpy.py
+# Dump char_cnn.keras weights → char_cnn_weights.npz for char_predictor's
+# NumPy backend. Re-run after train_char_cnn.py.
+import numpy as np
+from tensorflow import keras
+
+KERAS_FILE = "char_cnn.keras"
+WEIGHTS_FILE = "char_cnn_weights.npz"
+
+model = keras.models.load_model(KERAS_FILE)
+
+# one entry per op the NumPy engine knows: conv/dense (+ activation), pool, flatten
+ops, arrays = [], {}
+for layer in model.layers:
+    cfg = layer.get_config()
+    kind = type(layer).__name__
+    if kind == "Conv2D":
+        if cfg["padding"] != "valid" or tuple(cfg["strides"]) != (1, 1):
+            raise ValueError(f"{layer.name}: only stride-1 'valid' convolutions are supported")
+        op = "conv"
+    elif kind == "Dense":
+        op = "dense"
+    elif kind == "MaxPooling2D":
+        if tuple(cfg["pool_size"]) != (2, 2) or tuple(cfg["strides"]) != (2, 2):
+            raise ValueError(f"{layer.name}: only 2x2 max pooling is supported")
+        ops.append("pool")
+        continue
+    elif kind == "Flatten":
+        ops.append("flatten")
+        continue
+    else:
+        raise ValueError(f"{layer.name}: unsupported layer {kind}")
+
+    if cfg["activation"] not in ("relu", "softmax", "linear"):
+        raise ValueError(f"{layer.name}: unsupported activation {cfg['activation']}")
+    w, b = layer.get_weights()
+    arrays[f"w{len(ops)}"] = w.astype(np.float32)
+    arrays[f"b{len(ops)}"] = b.astype(np.float32)
+    ops.append(f"{op}_{cfg['activation']}")
+
+np.savez(WEIGHTS_FILE, ops=np.array(ops), **arrays)
+print(f"Wrote {WEIGHTS_FILE}: {' → '.join(ops)}")
+
+# sanity check against Keras
+from char_predictor import NumpyBackend
+x = (np.random.default_rng(0).random((64, 32, 32, 1)) > 0.5).astype(np.float32)
+got = NumpyBackend(WEIGHTS_FILE)(x)
+want = np.asarray(model.predict_on_batch(x))
+same = np.mean(got.argmax(1) == want.argmax(1))
+print(f"max |Δ| = {np.abs(got - want).max():.2e}, argmax agreement {same:.0%}")
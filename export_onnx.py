@@ -0,0 +1,38 @@
+# export_onnx.py
+# Convert char_cnn.keras → char_cnn.onnx for char_predictor's onnxruntime backend.
+# Re-run after train_char_cnn.py.
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+from tensorflow import keras
+
+KERAS_FILE = "char_cnn.keras"
+ONNX_FILE = "char_cnn.onnx"
+OPSET = 13
+
+model = keras.models.load_model(KERAS_FILE)
+
+# tf.function with a dynamic batch dim; works for Keras 3 models, which
+# tf2onnx.convert.from_keras does not handle
+spec = (tf.TensorSpec((None, 32, 32, 1), tf.float32, name="input"),)
+
+@tf.function(input_signature=spec)
+def serve(x):
+    return model(x, training=False)
+
+tf2onnx.convert.from_function(serve, input_signature=spec, opset=OPSET,
+                              output_path=ONNX_FILE)
+print(f"Wrote {ONNX_FILE}")
+
+# sanity check: both runtimes must agree on the same inputs
+try:
+    import onnxruntime as ort
+except ImportError:
+    print("onnxruntime not installed, skipping the check")
+else:
+    x = (np.random.default_rng(0).random((64, 32, 32, 1)) > 0.5).astype(np.float32)
+    sess = ort.InferenceSession(ONNX_FILE, providers=["CPUExecutionProvider"])
+    got = sess.run(None, {sess.get_inputs()[0].name: x})[0]
+    want = np.asarray(model.predict_on_batch(x))
+    same = np.mean(got.argmax(1) == want.argmax(1))
+    print(f"max |Δ| = {np.abs(got - want).max():.2e}, argmax agreement {same:.0%}")
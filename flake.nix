@@ -31,6 +31,8 @@
                 scikit-image
                 tensorflow
                 keras
+                onnxruntime
+                tf2onnx
                 evdev
                 pyinstaller
               ]
@@ -0,0 +1,106 @@
+# quantize_model.py
+# Post-training int8 quantization of char_cnn.onnx, calibrated on the
+# char_labels.csv glyphs, followed by a float-vs-int8 report.
+#   python export_onnx.py && python quantize_model.py
+import os
+import time
+import numpy as np
+import cv2
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod,
+                                      QuantFormat, QuantType, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from char_predictor import LABELS, ONNX_FILE, ONNX_INT8_FILE, OnnxBackend, preprocess
+from template_bank import LABEL_FILE, ALL_CHARS_DIR, binarize_template
+
+CALIB_BATCH = 64
+
+
+def load_labeled(label_file=LABEL_FILE, chars_dir=ALL_CHARS_DIR):
+    """(masks, labels) for every csv row the model has an output for."""
+    masks, labels = [], []
+    with open(label_file) as f:
+        for line in f:
+            fname, label = line.strip().split(",")
+            img = cv2.imread(os.path.join(chars_dir, fname), cv2.IMREAD_GRAYSCALE)
+            if img is None or label not in LABELS:
+                continue
+            masks.append(img)
+            labels.append(label)
+    return masks, labels
+
+
+class GlyphReader(CalibrationDataReader):
+    def __init__(self, batch, input_name):
+        self.chunks = iter([{input_name: batch[k:k + CALIB_BATCH]}
+                            for k in range(0, len(batch), CALIB_BATCH)])
+
+    def get_next(self):
+        return next(self.chunks, None)
+
+
+def quantize(batch):
+    prep = ONNX_INT8_FILE + ".prep.onnx"
+    quant_pre_process(ONNX_FILE, prep, skip_symbolic_shape=True)
+    input_name = OnnxBackend(prep).input_name
+    quantize_static(prep, ONNX_INT8_FILE, GlyphReader(batch, input_name),
+                    # QLinearConv/QLinearMatMul with u8 activations was the
+                    # fastest of QOperator/QDQ x u8/s8 on x86 CPUs
+                    quant_format=QuantFormat.QOperator,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                    calibrate_method=CalibrationMethod.MinMax)
+    os.remove(prep)
+    print(f"Wrote {ONNX_INT8_FILE}")
+
+
+def latency_ms(model, batch, n, reps=200):
+    x = batch[:n]
+    model(x)
+    times = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        model(x)
+        times.append(time.perf_counter() - t0)
+    return 1000 * float(np.median(times))
+
+
+def report(batch, labels, title):
+    models = {"float": OnnxBackend(ONNX_FILE), "int8": OnnxBackend(ONNX_INT8_FILE)}
+    preds = {name: np.array([LABELS[i] for i in m(batch).argmax(axis=1)])
+             for name, m in models.items()}
+    truth = np.array(labels)
+
+    print(f"\n{len(truth)} labeled glyphs, {title}")
+    print(f"{'class':<6}{'n':>6}{'float':>9}{'int8':>9}")
+    for lbl in sorted(set(labels), key=LABELS.index):
+        m = truth == lbl
+        print(f"{lbl:<6}{m.sum():>6}"
+              + "".join(f"{np.mean(preds[k][m] == lbl):>9.1%}" for k in models))
+    print(f"{'all':<6}{len(truth):>6}"
+          + "".join(f"{np.mean(preds[k] == truth):>9.1%}" for k in models))
+    print(f"int8 agrees with float on {np.mean(preds['int8'] == preds['float']):.1%}")
+
+def report_speed(batch):
+    models = {"float": OnnxBackend(ONNX_FILE), "int8": OnnxBackend(ONNX_INT8_FILE)}
+    print(f"\n{'':<6}{'size':>10}{'1 glyph':>10}{'25 glyphs':>11}{'64 glyphs':>11}")
+    for name, path in (("float", ONNX_FILE), ("int8", ONNX_INT8_FILE)):
+        m = models[name]
+        print(f"{name:<6}{os.path.getsize(path)/1024:>7.0f} KiB"
+              + "".join(f"{latency_ms(m, batch, n):>8.3f} ms" for n in (1, 25, 64)))
+
+
+if __name__ == "__main__":
+    masks, labels = load_labeled()
+    # csv files as train_char_cnn.py reads them, and the same glyphs the
+    # way HPSolver hands them over (white on black, like the template bank)
+    files = preprocess(masks)
+    runtime = preprocess([binarize_template(m) for m in masks])
+    quantize(np.concatenate([files, runtime]))
+    report(files, labels, "as stored (the training set, so this shows what "
+                          "quantization loses, not generalization)")
+    agree = np.mean(OnnxBackend(ONNX_FILE)(runtime).argmax(1)
+                    == OnnxBackend(ONNX_INT8_FILE)(runtime).argmax(1))
+    print(f"white-on-black masks: int8 agrees with float on {agree:.1%}")
+    report_speed(runtime)
@@ -0,0 +1,883 @@
+# recognition.py
+# Cell crop → text: segmentation, the glyph cascade, RGB line parsing.
+# Kept free of UI code so it runs headless (benchmarks, worker threads).
+import os
+import atexit
+import threading
+from itertools import islice
+import multiprocessing
+from multiprocessing import resource_tracker
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, wait,
+                                FIRST_COMPLETED)
+import numpy as np
+import cv2
+import char_predictor
+from char_predictor import predict_chars
+from template_bank import get_template_bank, share_template_bank
+from shared_arrays import ALIGN, SharedArrays, attach
+from recognition_cache import GlyphCache, CellCache
+from cascade import build_cascade, DEFAULT_ORDER
+from debug_sink import sink
+
+# Directories and valid chars
+UNKNOWN_DIR    = "unknown_chars"
+ALL_CHARS_DIR  = "all_chars"
+LABEL_FILE = "char_labels.csv"
+VALID_CHARS    = "0123456789!@#$%^&*()"
+
+# Recognized-glyph cache; set GLYPH_CACHE_FILE = None to keep it in memory only
+GLYPH_CACHE_SIZE = 4096
+GLYPH_CACHE_FILE = "glyph_cache.json"
+# Whole-cell results, keyed by the exact warped crop (in memory only)
+CELL_CACHE_SIZE  = 256
+# Glyph recognition cascade (cascade.py): stages tried in this order, a glyph
+# stops at the first one whose confidence clears its threshold.
+# Stages: "cache", "templates" (pruned), "full" (every template), "nn"
+CASCADE_ORDER      = DEFAULT_ORDER     # ("cache", "templates", "full", "nn")
+CASCADE_THRESHOLDS = {"templates": 0.65, "full": 0.65, "nn": 0.7}
+# Threads recognizing cells / matching glyphs in parallel (None → one per
+# CPU, 1 → no pool). The OpenCV/NumPy work releases the GIL.
+RECOGNITION_WORKERS = 4
+# "threads", or "processes": worker processes forked once per session (see
+# start_pool), with the template bank and each scan's cells handed over in
+# shared memory instead of being pickled. Needs the "fork" start method;
+# elsewhere (Windows, macOS default) it falls back to threads.
+RECOGNITION_MODE = "threads"
+
+# Ensure directories exist
+for d in (UNKNOWN_DIR, ALL_CHARS_DIR):
+    os.makedirs(d, exist_ok=True)
+
+def load_templates():
+    # compiled bank, only rebuilt when char_labels.csv / all_chars change
+    templates = get_template_bank(LABEL_FILE, ALL_CHARS_DIR)
+    glyph_cache.sync(templates.fingerprint)
+    cell_cache.sync(templates.fingerprint)
+    return templates
+
+glyph_cache = GlyphCache(GLYPH_CACHE_SIZE, GLYPH_CACHE_FILE)
+cell_cache = CellCache(CELL_CACHE_SIZE)
+cascade = build_cascade(CASCADE_ORDER, CASCADE_THRESHOLDS, cache=glyph_cache,
+                        predict_batch=predict_chars, nn_ready=char_predictor.is_ready,
+                        nn_failed=char_predictor.is_failed)
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+def _pool_mode(mode):
+    if mode == "processes" and "fork" not in multiprocessing.get_all_start_methods():
+        print("Process pool needs the 'fork' start method; using threads")
+        return "threads"
+    return mode
+
+def get_pool(workers=None, mode=None):
+    """
+    Shared pool with `workers` workers (default RECOGNITION_WORKERS) of
+    `mode` (default RECOGNITION_MODE), rebuilt if either changes.
+    None when 1 worker is asked for.
+    """
+    global _pool, _pool_key
+    if workers is None:
+        workers = RECOGNITION_WORKERS or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    mode = _pool_mode(mode or RECOGNITION_MODE)
+    with _pool_lock:
+        # a worker process that died (crash, OOM kill) breaks the whole
+        # executor for good; start a fresh one instead of failing every scan
+        broken = getattr(_pool, "_broken", False)
+        if broken:
+            print(f"Recognition pool broken ({broken}), restarting it")
+        if _pool_key != (workers, mode) or broken:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            if mode == "processes":
+                # workers must inherit the resource tracker; one they start
+                # themselves would unlink the shared blocks when they exit
+                resource_tracker.ensure_running()
+                _pool = ProcessPoolExecutor(
+                    workers, mp_context=multiprocessing.get_context("fork"))
+            else:
+                _pool = ThreadPoolExecutor(workers, thread_name_prefix="recognize")
+            _pool_key = (workers, mode)
+        return _pool
+
+def start_pool(workers=None, mode=None):
+    """
+    Create the pool now rather than on the first scan. Process workers
+    are started lazily by the executor, so one no-op task each forks them.
+    """
+    pool = get_pool(workers, mode)
+    if isinstance(pool, ProcessPoolExecutor):
+        for f in [pool.submit(os.getpid) for _ in range(pool._max_workers)]:
+            f.result()
+    return pool
+
+def _map(pool, fn, items):
+    """
+    list(map(fn, items)), on the pool when it is a thread pool; keeps order.
+    Process pools only take picklable work, see _prepare_cells.
+    """
+    if pool is None or isinstance(pool, ProcessPoolExecutor):
+        return [fn(x) for x in items]
+    return list(pool.map(fn, items))
+
+# Process mode: the bank is copied into shared memory once per fingerprint.
+# Each call gets a scan buffer of its own for its cells (an F8 press can
+# run while a grid scan is still being read by the workers); idle buffers
+# are kept for reuse.
+_shared_bank = None       # (SharedArrays owner, SharedTemplateBank)
+_scan_bufs = []           # idle SharedArrays
+KEEP_SCAN_BUFFERS = 2
+_shared_lock = threading.Lock()
+
+def _pool_templates(pool, templates):
+    """templates as the pool should receive them"""
+    global _shared_bank
+    if not isinstance(pool, ProcessPoolExecutor):
+        return templates
+    with _shared_lock:
+        if _shared_bank is None or _shared_bank[1].fingerprint != templates.fingerprint:
+            if _shared_bank is not None:
+                _shared_bank[0].close()
+            _shared_bank = share_template_bank(templates)
+        return _shared_bank[1]
+
+def index_report(templates, workers=None):
+    """templates.index.report(), unless the lookups happen elsewhere"""
+    if isinstance(get_pool(workers), ProcessPoolExecutor):
+        # the workers query their own attached copy of the index
+        return ("Template index: pruned lookups run in the worker processes, "
+                "pruning ratio not tracked in process mode")
+    return templates.index.report()
+
+def _acquire_scan_buffer(cells):
+    """(buffer, spec) with cells copied into an idle buffer or a new one"""
+    arrays = {str(k): c for k, c in enumerate(cells)}
+    need = sum(-(-c.nbytes // ALIGN) * ALIGN for c in cells)
+    with _shared_lock:
+        fits = [b for b in _scan_bufs if b.size >= need]
+        buf = min(fits, key=lambda b: b.size) if fits else None
+        if buf is not None:
+            _scan_bufs.remove(buf)
+    if buf is None:
+        buf = SharedArrays({}, min_size=2 * need)
+    return buf, buf.write(arrays)
+
+def _release_scan_buffer(buf):
+    """Back to the idle list once no worker reads it any more"""
+    with _shared_lock:
+        _scan_bufs.append(buf)
+        _scan_bufs.sort(key=lambda b: b.size, reverse=True)
+        extra = _scan_bufs[KEEP_SCAN_BUFFERS:]
+        del _scan_bufs[KEEP_SCAN_BUFFERS:]
+    for b in extra:
+        b.close()
+
+def _close_shared():
+    global _shared_bank
+    if _shared_bank is not None:
+        _shared_bank[0].close()
+    _shared_bank = None
+    with _shared_lock:
+        bufs = _scan_bufs[:]
+        _scan_bufs.clear()
+    for b in bufs:
+        b.close()
+
+atexit.register(_close_shared)
+
+def _prepare_shared(task):
+    """Worker side: prepare_cell on a cell from the scan buffer."""
+    spec, key, debug_prefix = task
+    prep = prepare_cell(attach(spec)[key], None, debug_prefix)
+    # crops are views of the shared cell; the parent rebuilds them
+    prep['cell'] = None
+    for ln in prep['lines']:
+        ln['chars'] = None
+    return prep
+
+def _prepare_iter(pool, cells, templates, debug_prefixes, window=None):
+    """
+    (index, prepare_cell result) for every cell, as each one finishes.
+    With `window`, at most that many cells are submitted at a time, so
+    work the caller puts on the pool in between does not wait for all.
+    """
+    if pool is None:
+        for k, (cell, prefix) in enumerate(zip(cells, debug_prefixes)):
+            yield k, prepare_cell(cell, templates, prefix)
+        return
+    buf = None
+    if isinstance(pool, ProcessPoolExecutor) and cells:
+        buf, spec = _acquire_scan_buffer(cells)
+        submit = lambda k: pool.submit(_prepare_shared, (spec, str(k), debug_prefixes[k]))
+    else:
+        submit = lambda k: pool.submit(prepare_cell, cells[k], templates, debug_prefixes[k])
+    order = iter(range(len(cells)))
+    futs, running = [], {}
+    def _more(n):
+        for k in islice(order, n):
+            f = submit(k)
+            futs.append(f)
+            running[f] = k
+    _more(window or len(cells))
+    try:
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            _more(len(done))
+            for f in done:
+                k, prep = running.pop(f), f.result()
+                if prep['cell'] is None:
+                    # back from a worker process: crops from our own copy
+                    cell = prep['cell'] = cells[k]
+                    for ln in prep['lines']:
+                        ln['chars'] = [cell[y0:y1, x0:x1] for x0, x1, y0, y1 in ln['pads']]
+                yield k, prep
+    finally:
+        if buf is not None:
+            # also when the caller stopped early: workers may still read it
+            wait(futs)
+            _release_scan_buffer(buf)
+
+def _prepare_cells(pool, cells, templates, debug_prefixes):
+    """prepare_cell for every cell, on the pool when there is one"""
+    preps = dict(_prepare_iter(pool, cells, templates, debug_prefixes))
+    return [preps[k] for k in range(len(cells))]
+
+def recognize_cells_cached(cells, templates, debug_prefixes=None, on_update=None,
+                           workers=None, on_cell=None):
+    """
+    recognize_cells, skipping every crop that was seen before.
+    Returns one string per cell, in order.
+    Results stream: on_cell(k, text) is called (from this thread) for the
+    cached cells first, then for each cell as soon as it is segmented and
+    matched against the templates; cells with glyphs left for the NN come
+    last, after one NN batch for the whole call.
+    While the character CNN is still loading, glyphs that need it read '?'
+    and are queued; once it is ready they go through in one NN batch,
+    on_cell is called again for their cells and on_update(results) once,
+    from the loader thread.
+    Cells are segmented and matched on `workers` threads or processes
+    (RECOGNITION_MODE).
+    """
+    if debug_prefixes is None:
+        debug_prefixes = [None] * len(cells)
+    pool = get_pool(workers)
+    results = [cell_cache.get(c) for c in cells]
+    todo = [k for k, txt in enumerate(results) if txt is None]
+    if on_cell:
+        for k, txt in enumerate(results):
+            if txt is not None:
+                on_cell(k, txt)
+    preps = {}
+
+    def _finish(ks):
+        for k in ks:
+            txt = finish_cell(preps[k], templates)
+            results[k] = txt
+            if '?' not in txt:
+                cell_cache.put(cells[k], txt)
+            if on_cell:
+                on_cell(k, txt)
+
+    # each cell's glyphs go through the stages before the NN (matching on
+    # the pool) as soon as it is segmented. Only as many cells as there
+    # are workers are being segmented at a time, so that matching never
+    # queues behind the whole scan. Cells settled before the NN are
+    # reported right away; glyphs that reach it wait for one batch at the
+    # end, then go through the NN and whatever follows it in the order.
+    bank = _pool_templates(pool, templates)
+    window = pool._max_workers if pool is not None else None
+    waiting = []
+    for i, prep in _prepare_iter(pool, [cells[k] for k in todo], templates,
+                                 [debug_prefixes[k] for k in todo], window):
+        k = todo[i]
+        preps[k] = prep
+        if classify_glyphs([prep], bank, pool=pool, hold=("nn",)):
+            waiting.append(k)
+        else:
+            _finish([k])
+    if not waiting:
+        return results
+    queued = classify_glyphs([preps[k] for k in waiting], bank, pool=pool, start="nn")
+    _finish(waiting)
+    if not queued:
+        return results
+    print(f"Character CNN still loading → {queued} glyphs queued")
+
+    def _late():
+        classify_glyphs([preps[k] for k in waiting], templates, only=("nn",))
+        _finish(waiting)
+        if on_update:
+            on_update(list(results))
+    char_predictor.when_ready(_late)
+    return list(results)
+
+def classify_glyphs(preps, templates, only=None, pool=None, hold=(), start=None):
+    """
+    Run the cascade once over every unlabeled glyph of the prepared cells
+    (from stage `start` on, if given). Glyphs no stage is sure about
+    become '?', except those waiting on a stage that is still loading or
+    held back (`hold`): they stay None. Returns how many wait.
+    """
+    pending = [(prep, idx) for prep in preps
+               for idx, lbl in enumerate(prep['labels']) if lbl is None]
+    if not pending:
+        return 0
+    masks = [prep['masks'][idx] for prep, idx in pending]
+    labels, confs, by, deferred = cascade.classify(masks, templates, only, pool,
+                                                   hold, start)
+    waiting = set(deferred)
+    for k, (prep, idx) in enumerate(pending):
+        if labels[k] is None:
+            prep['labels'][idx] = None if k in waiting else '?'
+            continue
+        prep['labels'][idx] = labels[k]
+        if by[k] != "cache":
+            glyph_cache.put(masks[k], labels[k], confs[k])
+    return len(waiting)
+
+def recognize_glyph(mask, templates):
+    """
+    Label for one binarized glyph through the cascade.
+    Returns (label, confidence); label is '?' when nothing is confident.
+    """
+    labels, confs, by, _ = cascade.classify([mask], templates)
+    if labels[0] is None:
+        return '?', confs[0]
+    if by[0] != "cache":
+        glyph_cache.put(mask, labels[0], confs[0])
+    return labels[0], confs[0]
+
+def save_new_template(char_img, label, templates):
+    fname = os.path.join(TEMPLATE_DIR, f"{label}.png")
+    if not os.path.exists(fname):
+        if len(char_img.shape) == 3:
+            gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = char_img.copy()
+        _, bin_img = cv2.threshold(gray, 0, 255,
+                                   cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if np.mean(bin_img) > 127:
+            bin_img = 255 - bin_img
+        cv2.imwrite(fname, bin_img)
+        print(f"Saved new template: {fname}")
+        templates[label] = bin_img
+
+def save_unknown(char_img, i, j, idx):
+    fname = os.path.join(UNKNOWN_DIR, f"char_{i}_{j}_{idx}.png")
+    if len(char_img.shape) == 3:
+        gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = char_img.copy()
+    _, bin_img = cv2.threshold(gray, 0, 255,
+                               cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.mean(bin_img) > 127:
+        bin_img = 255 - bin_img
+    cv2.imwrite(fname, bin_img)
+    print(f"Saved unknown character: {fname}")
+
+def save_all_char(char_img, i, j, idx, label):
+    fname = os.path.join(ALL_CHARS_DIR,
+                         f"char_{i}_{j}_{idx}_{label}.png")
+    if len(char_img.shape) == 3:
+        gray = cv2.cvtColor(char_img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = char_img.copy()
+    _, bin_img = cv2.threshold(gray, 0, 255,
+                               cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.mean(bin_img) > 127:
+        bin_img = 255 - bin_img
+    cv2.imwrite(fname, bin_img)
+
+def merge_boxes(pads, x_thresh=10, y_thresh=12):
+    """
+    Merge boxes that are close in x and y.
+    pads: list of (x0, x1, y0, y1)
+    Returns: list of merged boxes
+    """
+    merged = []
+    used = [False] * len(pads)
+    for i, (x0, x1, y0, y1) in enumerate(pads):
+        if used[i]:
+            continue
+        group = [(x0, x1, y0, y1)]
+        used[i] = True
+        for j, (xx0, xx1, yy0, yy1) in enumerate(pads):
+            if i == j or used[j]:
+                continue
+            # If horizontally aligned and close vertically, or vice versa
+            x_overlap = min(x1, xx1) - max(x0, xx0)
+            x_close = x_overlap > -x_thresh  # allow a little gap
+            y_gap = min(abs(y1 - yy0), abs(yy1 - y0))
+            y_close = y_gap < y_thresh
+            if x_close and y_close:
+                group.append((xx0, xx1, yy0, yy1))
+                used[j] = True
+        gx0 = min(g[0] for g in group)
+        gx1 = max(g[1] for g in group)
+        gy0 = min(g[2] for g in group)
+        gy1 = max(g[3] for g in group)
+        merged.append((gx0, gx1, gy0, gy1))
+    return merged
+
+def filter_contained_boxes(boxes, epsilon=2):
+    """
+    Remove boxes that are fully contained within another box.
+    Keeps only the largest (outer) box in such cases.
+    """
+    keep = [True] * len(boxes)
+    for i, (x0, x1, y0, y1) in enumerate(boxes):
+        for j, (xx0, xx1, yy0, yy1) in enumerate(boxes):
+            if i == j:
+                continue
+            # If box i is fully inside box j
+            if (x0 >= xx0 - epsilon and x1 <= xx1 + epsilon and
+                y0 >= yy0 - epsilon and y1 <= yy1 + epsilon):
+                # If box j is strictly larger, mark i for removal
+                if (xx1-xx0)*(yy1-yy0) > (x1-x0)*(y1-y0):
+                    keep[i] = False
+                    break
+    return [box for k, box in zip(keep, boxes) if k]
+
+def group_into_lines(pads, chars, line_gap=0):
+    # Sort by y (top)
+    items = sorted(zip(pads, chars), key=lambda t: t[0][2])
+    lines = []
+    for pad, char in items:
+        x0, x1, y0, y1 = pad
+        placed = False
+        for line in lines:
+            # Get the max bottom of the current line
+            max_y1 = max(p[3] for p in line['pads'])
+            if y0 <= max_y1 + line_gap:
+                line['chars'].append(char)
+                line['pads'].append(pad)
+                placed = True
+                break
+        if not placed:
+            lines.append({'chars': [char], 'pads': [pad]})
+    return lines
+
+def segment_characters(cell_img, debug_prefix=None):
+    gray = cv2.cvtColor(cell_img, cv2.COLOR_BGR2GRAY)
+    _, th = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.mean(th) > 127:
+        th = 255 - th
+    if debug_prefix:
+        sink.imwrite(f"{debug_prefix}_thresh.png", th)
+
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(th, connectivity=8)
+    pads = []
+    for i in range(1, num_labels):  # skip background
+        x, y, w, h, area = stats[i]
+        if area < 10:
+            continue
+        pads.append((x, x+w, y, y+h))
+
+    # --- Merge close blobs (tune x_thresh and y_thresh as needed) ---
+    # merged_pads = merge_boxes(pads, x_thresh=10, y_thresh=12)
+    merged_pads = pads
+
+    filtered_pads = filter_contained_boxes(merged_pads, epsilon=2)
+
+    chars_out, pads_out = [], []
+    for x0, x1, y0, y1 in filtered_pads:
+        chars_out.append(cell_img[y0:y1, x0:x1])
+        pads_out.append((x0, x1, y0, y1))
+
+    # --- Group into lines and sort left-to-right within each line ---
+    if len(chars_out) > 1:
+        lines = group_into_lines(pads_out, chars_out, line_gap=3)
+        chars_out, pads_out = [], []
+        for line in lines:
+            line_sorted = sorted(zip(line['pads'], line['chars']), key=lambda t: t[0][0])
+            for pad, char in line_sorted:
+                pads_out.append(pad)
+                chars_out.append(char)
+
+    if debug_prefix:
+        dbg = cv2.cvtColor(th, cv2.COLOR_GRAY2BGR)
+        for x0, x1, y0, y1 in pads_out:
+            cv2.rectangle(dbg, (x0, y0), (x1-1, y1-1), (0,255,0), 1)
+        sink.imwrite(f"{debug_prefix}_split.png", dbg)
+
+    return chars_out, pads_out
+
+def unified_binarize_char(char_img,
+                          white_thresh=40,
+                          close_kernel=(1,1)):
+    """
+    Very simple “white‐text” binarizer:
+      - Any pixel where R,G,B are all ≥ white_thresh → foreground (255)
+      - Everything else → background (0)
+      - Tiny closing to join broken strokes.
+
+    Returns a H×W uint8 mask (0=bg, 255=fg).
+    """
+    # split channels
+    b,g,r = cv2.split(char_img)
+    # mask white pixels
+    mask = ((b >= white_thresh) &
+            (g >= white_thresh) &
+            (r >= white_thresh)).astype(np.uint8) * 255
+
+    # tiny closing
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, close_kernel
+    )
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return mask
+
+def cluster_pads_and_chars(pads, cell_img, overlap_thresh=0.3):
+    """
+    Merge any pads in the *one line* whose horizontal overlap
+    >= overlap_thresh×min(widths).  Return sorted-by-x0 lists
+    of new_pads and new_char_imgs.
+    """
+    if len(pads) <= 1:
+        # nothing to merge
+        chars = [ cell_img[y0:y1, x0:x1] for x0,x1,y0,y1 in pads ]
+        return pads, chars
+
+    # widths of each pad
+    widths = [(x1-x0) for x0,x1,y0,y1 in pads]
+    n = len(pads)
+    used = [False]*n
+    clusters = []
+
+    # build adjacency by horizontal overlap
+    for i in range(n):
+        if used[i]:
+            continue
+        used[i] = True
+        group = [i]
+        stack = [i]
+        while stack:
+            k = stack.pop()
+            x0k,x1k,y0k,y1k = pads[k]
+            wk = widths[k]
+            for j in range(n):
+                if used[j]:
+                    continue
+                x0j,x1j,y0j,y1j = pads[j]
+                wj = widths[j]
+                overlap = max(0, min(x1k, x1j) - max(x0k, x0j))
+                if overlap >= min(wk, wj)*overlap_thresh:
+                    used[j] = True
+                    stack.append(j)
+                    group.append(j)
+        clusters.append(group)
+
+    # now build merged pads & char crops
+    merged = []
+    for group in clusters:
+        x0 = min(pads[i][0] for i in group)
+        x1 = max(pads[i][1] for i in group)
+        y0 = min(pads[i][2] for i in group)
+        y1 = max(pads[i][3] for i in group)
+        merged.append((x0,x1,y0,y1))
+
+    # sort left→right
+    merged.sort(key=lambda p: p[0])
+
+    # extract char images
+    chars = [ cell_img[y0:y1, x0:x1] for x0,x1,y0,y1 in merged ]
+    return merged, chars
+
+def prepare_cell(cell_img, templates, debug_prefix=None):
+    """
+    Steps 1-4 of recognize_cell, minus the NN:
+    1) raw CC segmentation → raw_chars, raw_pads
+    2) group_into_lines on raw_pads → lines0
+    3) for each line in lines0:
+         cluster_pads_and_chars(line['pads'], cell_img)
+       → collect merged_pads / merged_chars per line
+    4) per-glyph binarize → masks (labels left None for the cascade)
+    """
+    # 1) segment
+    raw_chars, raw_pads = segment_characters(cell_img)
+
+    # 2) group into lines (vertical grouping)
+    lines0 = group_into_lines(raw_pads, raw_chars, line_gap=3)
+
+    # 3) within each line, cluster
+    all_pads, all_chars = [], []
+    merged_lines = []
+    for ln in lines0:
+        pads_i = ln['pads']
+        merged_pads, merged_chars = cluster_pads_and_chars(pads_i, cell_img)
+        merged_lines.append({'pads': merged_pads, 'chars': merged_chars})
+        all_pads.extend(merged_pads)
+        all_chars.extend(merged_chars)
+
+    # 4) per-glyph masks; recognition runs batched over all cells
+    masks, labels = [], []
+    for idx, ch in enumerate(all_chars):
+        mask = unified_binarize_char(ch)
+        masks.append(mask)
+        labels.append(None)
+
+        # per-glyph debug dumps
+        if debug_prefix:
+            # ch may be a view of the shared scan buffer (process mode),
+            # which the next scan overwrites before the writer gets to it
+            sink.imwrite(f"{debug_prefix}_char_{idx}.png", ch.copy())
+            sink.imwrite(f"{debug_prefix}_mask_{idx}.png", mask)
+
+    return {'cell': cell_img, 'lines': merged_lines, 'pads': all_pads,
+            'masks': masks, 'labels': labels, 'debug_prefix': debug_prefix}
+
+def finish_cell(prep, templates):
+    """
+    5) full debug dumps if debug_prefix≠None
+    6) if only one line → return that string
+       else → call parse_rgb_from_lines on the merged lines
+               and join non‐empty with spaces
+    """
+    cell_img, merged_lines = prep['cell'], prep['lines']
+    all_pads, labels = prep['pads'], prep['labels']
+    debug_prefix = prep['debug_prefix']
+
+    # 5) full‐cell debug
+    if debug_prefix:
+        sink.imwrite(f"{debug_prefix}_cell.png", cell_img)
+        dbg = cell_img.copy()
+        for (x0,x1,y0,y1), lbl in zip(all_pads, labels):
+            cv2.rectangle(dbg, (x0,y0), (x1,y1), (0,255,0), 1)
+            cv2.putText(dbg, lbl or '?', (x0, max(0,y0-3)),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, (0,255,0), 1, cv2.LINE_AA)
+        sink.imwrite(f"{debug_prefix}_recognized.png", dbg)
+
+    # 6) build line_strs from labels + merged_lines
+    line_counts = [len(ln['pads']) for ln in merged_lines]
+    line_strs = []
+    ptr = 0
+    for ln, cnt in zip(merged_lines, line_counts):
+        ln['labels'] = labels[ptr:ptr+cnt]
+        # None = still waiting for the NN
+        line_strs.append("".join(lbl or '?' for lbl in ln['labels']))
+        ptr += cnt
+
+    # single line → return raw
+    if len(line_strs) == 1:
+        return line_strs[0]
+
+    # multi-line → RGB parse + drop empty + join with spaces
+    rgb = parse_rgb_from_lines(merged_lines, templates)
+    rgb = [c for c in rgb if c]
+    return " ".join(rgb)
+
+def recognize_cells(cells, templates, debug_prefixes=None, workers=None):
+    """
+    recognize_cell for many cells, with one cascade pass (and so one NN
+    batch) for all of them. Waits for the NN if it is still loading; if
+    it then fails to load, the glyphs that needed it read '?'.
+    """
+    if debug_prefixes is None:
+        debug_prefixes = [None] * len(cells)
+    pool = get_pool(workers)
+    preps = _prepare_cells(pool, cells, templates, debug_prefixes)
+    if classify_glyphs(preps, _pool_templates(pool, templates), pool=pool):
+        try:
+            char_predictor.get_backend()
+        except RuntimeError:
+            pass      # failed to load: the NN stage is left out, glyphs read '?'
+        classify_glyphs(preps, templates, only=("nn",))
+    return _map(pool, lambda prep: finish_cell(prep, templates), preps)
+
+def recognize_cell(cell_img, templates, debug_prefix=None):
+    return recognize_cells([cell_img], templates, [debug_prefix])[0]
+
+def group_characters_into_lines(chars_out, pads_out):
+    """
+    Group characters into lines using the same logic as segment_characters
+    Returns list of line dictionaries with chars and pads
+    """
+    if len(chars_out) <= 1:
+        return [{'chars': chars_out, 'pads': pads_out}] if chars_out else []
+    
+    # Use the same line grouping logic as segment_characters
+    lines = []
+    for pad, char in sorted(zip(pads_out, chars_out), key=lambda t: t[0][2]):  # sort by y (top)
+        x0, x1, y0, y1 = pad
+        placed = False
+        for line in lines:
+            if any(y0 <= prev_y1 for _, _, _, prev_y1 in line['pads']):
+                line['chars'].append(char)
+                line['pads'].append(pad)
+                placed = True
+                break
+        if not placed:
+            lines.append({'chars': [char], 'pads': [pad]})
+    
+    # Sort characters within each line left-to-right
+    for line in lines:
+        line_sorted = sorted(zip(line['pads'], line['chars']), key=lambda t: t[0][0])
+        line['pads'] = [pad for pad, char in line_sorted]
+        line['chars'] = [char for pad, char in line_sorted]
+    
+    return lines
+
+def detect_gaps_in_line(pads, gap_threshold_ratio=1.0):
+    """
+    Detect significant gaps between characters in a line
+    
+    Args:
+        pads: List of character bounding boxes in the line
+        gap_threshold_ratio: Minimum gap as ratio of average character width
+    
+    Returns:
+        gap_positions: List of indices where significant gaps occur
+    """
+    if len(pads) < 2:
+        return []
+    
+    # Calculate average character width
+    char_widths = [x1 - x0 for x0, x1, y0, y1 in pads]
+    avg_char_width = sum(char_widths) / len(char_widths)
+    gap_threshold = avg_char_width * gap_threshold_ratio
+    
+    gaps = []
+    for i in range(len(pads) - 1):
+        current_x1 = pads[i][1]
+        next_x0 = pads[i + 1][0]
+        gap_size = next_x0 - current_x1
+        
+        if gap_size > gap_threshold:
+            gaps.append(i + 1)  # Gap after character i
+    
+    return gaps
+
+def recognize_line_text(chars, templates, labels=None):
+    """
+    Recognize text from a line of characters
+    
+    Args:
+        chars: List of character images
+        templates: Template dictionary for matching
+        labels: Labels already decided by recognize_cells, if any
+    
+    Returns:
+        recognized_text: String of recognized characters
+    """
+    recognized = []
+    
+    for idx, ch in enumerate(chars):
+        # Binarize character using foreground color method (white text)
+        tbin = unified_binarize_char(ch)
+        
+        # Cache, then template matching, then neural network
+        if labels is not None:
+            label = labels[idx]
+            if label is None:
+                # queued for the NN, decided later
+                recognized.append('?')
+                continue
+        else:
+            label, score = recognize_glyph(tbin, templates)
+        recognized.append(label)
+        if label == '?':
+            save_unknown(tbin, 0, 0, idx)
+    
+    return "".join(recognized)
+
+def parse_rgb_from_lines(lines, templates):
+    """
+    Parse R/G/B values from detected lines
+    Minimum is 2 lines, maximum is 3 lines
+    
+    Args:
+        lines: List of line dictionaries from group_characters_into_lines
+        templates: Template dictionary for character recognition
+    
+    Returns:
+        [R_value, G_value, B_value]
+    """
+    def text(line, start=0, end=None):
+        labels = line.get('labels')
+        if labels is not None:
+            labels = labels[start:end]
+        return recognize_line_text(line['chars'][start:end], templates, labels)
+
+    if len(lines) == 3:
+        # Each line is a separate R/G/B component
+        r_value = text(lines[0])
+        g_value = text(lines[1])
+        b_value = text(lines[2])
+        
+        print(f"3 lines detected: R='{r_value}', G='{g_value}', B='{b_value}'")
+        return [r_value, g_value, b_value]
+    
+    elif len(lines) == 2:
+        # One line has two components, other has one
+        # Detect which line has the gap
+        line1_gaps = detect_gaps_in_line(lines[0]['pads'])
+        line2_gaps = detect_gaps_in_line(lines[1]['pads'])
+        
+        if line1_gaps and not line2_gaps:
+            # First line has two components, second line has one
+            line2_text = text(lines[1])
+            
+            # Split first line at the gap
+            gap_pos = line1_gaps[0]
+            part1_text = text(lines[0], 0, gap_pos)
+            part2_text = text(lines[0], gap_pos)
+            
+            print(f"2 lines: Line1 split at gap: '{part1_text}' + '{part2_text}', Line2: '{line2_text}'")
+            return [part1_text, part2_text, line2_text]
+        
+        elif line2_gaps and not line1_gaps:
+            # Second line has two components, first line has one
+            line1_text = text(lines[0])
+            
+            # Split second line at the gap
+            gap_pos = line2_gaps[0]
+            part1_text = text(lines[1], 0, gap_pos)
+            part2_text = text(lines[1], gap_pos)
+            
+            print(f"2 lines: Line1: '{line1_text}', Line2 split at gap: '{part1_text}' + '{part2_text}'")
+            return [line1_text, part1_text, part2_text]
+        
+        else:
+            # No clear gaps or multiple gaps - fall back to simple split
+            # Assume first line is R, second line is G, B is empty
+            line1_text = text(lines[0])
+            line2_text = text(lines[1])
+            
+            print(f"2 lines (no clear gaps): R='{line1_text}', G='{line2_text}', B=''")
+            return [line1_text, line2_text, ""]
+    
+    else:
+        print(f"Unexpected number of lines: {len(lines)} (minimum should be 2)")
+        if len(lines) == 1:
+            # Fallback: try to detect gaps in the single line
+            gaps = detect_gaps_in_line(lines[0]['pads'])
+            
+            if len(gaps) >= 2:
+                # Split into three parts
+                part1_text = text(lines[0], 0, gaps[0])
+                part2_text = text(lines[0], gaps[0], gaps[1])
+                part3_text = text(lines[0], gaps[1])
+                
+                print(f"1 line with 2 gaps (fallback): '{part1_text}', '{part2_text}', '{part3_text}'")
+                return [part1_text, part2_text, part3_text]
+            
+            elif len(gaps) == 1:
+                # Split into two parts
+                part1_text = text(lines[0], 0, gaps[0])
+                part2_text = text(lines[0], gaps[0])
+                
+                print(f"1 line with 1 gap (fallback): '{part1_text}', '{part2_text}', ''")
+                return [part1_text, part2_text, ""]
+            
+            else:
+                # No gaps - single component
+                line_text = text(lines[0])
+                print(f"1 line (no gaps, fallback): '{line_text}', '', ''")
+                return [line_text, "", ""]
+        
+        return ["", "", ""]
+
@@ -0,0 +1,151 @@
+# recognition_cache.py
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def glyph_key(mask):
+    """
+    Content address of a binarized glyph: shape + bit-packed fg pixels.
+    Any 0/255 (or 0/1) mask with the same ink pattern gives the same key.
+    """
+    h, w = mask.shape[:2]
+    bits = np.packbits(mask > 0)
+    return hashlib.blake2b(f"{h}x{w}:".encode() + bits.tobytes(),
+                           digest_size=16).hexdigest()
+
+def cell_key(cell_img):
+    """
+    Exact address of a warped cell crop. An unchanged screen warps to
+    identical bytes; anything fuzzier could hand back another cell's digits.
+    """
+    cell_img = np.ascontiguousarray(cell_img)
+    return hashlib.blake2b(str(cell_img.shape).encode() + cell_img.tobytes(),
+                           digest_size=16).hexdigest()
+
+
+class LRUCache:
+    """
+    Bounded LRU of image key -> recognition result. Entries are tied to
+    the template bank fingerprint they were decided with; sync() drops
+    them when the bank changes. Optionally persisted as JSON.
+    """
+    name = "Cache"
+
+    def __init__(self, max_size=4096, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.fingerprint = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = self.misses = 0            # since reset_stats()
+        self.total_hits = self.total_misses = 0
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, img):
+        raise NotImplementedError
+
+    def _from_json(self, value):
+        return value
+
+    def sync(self, fingerprint):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self._entries:
+                    print(f"{self.name}: templates changed, clearing")
+                self._entries.clear()
+                self.fingerprint = fingerprint
+                self._dirty = True
+
+    def get(self, img):
+        key = self._key(img)
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                self.misses += 1
+                self.total_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.total_hits += 1
+            return hit
+
+    def put(self, img, value):
+        key = self._key(img)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+
+    def report(self):
+        n = self.hits + self.misses
+        rate = 100 * self.hits / n if n else 0.0
+        return (f"{self.name}: {self.hits} hits / {self.misses} misses ({rate:.0f}%), "
+                f"{len(self)} entries, {self.total_hits} hits this session")
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.fingerprint = data.get("fingerprint")
+            for key, value in data.get("entries", [])[-self.max_size:]:
+                self._entries[key] = self._from_json(value)
+        print(f"{self.name}: loaded {len(self)} entries from {self.path}")
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            data = {"fingerprint": self.fingerprint,
+                    "entries": [[k, v] for k, v in self._entries.items()]}
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save {self.name.lower()}: {e}")
+
+
+class GlyphCache(LRUCache):
+    """glyph_key(mask) -> (label, score) of a past decision"""
+    name = "Glyph cache"
+
+    def _key(self, mask):
+        return glyph_key(mask)
+
+    def _from_json(self, value):
+        return tuple(value)
+
+    def put(self, mask, label, score):
+        super().put(mask, (label, float(score)))
+
+
+class CellCache(LRUCache):
+    """cell_key(cell crop) -> recognized cell string"""
+    name = "Cell cache"
+
+    def _key(self, cell_img):
+        return cell_key(cell_img)
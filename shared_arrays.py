@@ -0,0 +1,127 @@
+# shared_arrays.py
+# Named groups of numpy arrays in one multiprocessing.shared_memory block,
+# so worker processes can attach by name instead of receiving pickled copies.
+# SharedMemory.close() unmaps the block even while numpy views of it are
+# alive (it does not raise), so blocks are only closed once every view
+# handed out is gone; see _retire().
+import threading
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+
+ALIGN = 64
+
+
+class SharedArrays:
+    """
+    Owner side: copies `arrays` (name -> ndarray) into a fresh block.
+    .spec is small and picklable; attach(spec) gives a worker the same
+    arrays without copying. The owner unlinks the block in close().
+    """
+    def __init__(self, arrays, min_size=0):
+        layout, size = _layout(arrays)
+        self.size = max(size, min_size, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size)
+        self._refs = []
+        self.write(arrays)
+
+    def write(self, arrays):
+        """
+        Replace the contents with `arrays` (must fit in .size) and return
+        the new spec. Lets one block carry a different set every round.
+        """
+        layout, size = _layout(arrays)
+        if size > self.size:
+            raise ValueError(f"{size} bytes do not fit in a {self.size} byte block")
+        self.spec = (self.shm.name, layout)
+        self.arrays = _views(self.shm, layout)
+        self._refs = _live(self._refs, self.arrays)
+        for key, arr in arrays.items():
+            self.arrays[key][...] = arr
+        return self.spec
+
+    def close(self):
+        """Unlink now; unmap once no view from .arrays is left."""
+        self.arrays = {}
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        _retire(self.shm, self._refs)
+        self._refs = []
+
+
+def _layout(arrays):
+    layout, offset = {}, 0
+    for key, arr in arrays.items():
+        layout[key] = (offset, arr.dtype.str, arr.shape)
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    return layout, offset
+
+def _views(shm, layout):
+    return {key: np.ndarray(shape, dtype=np.dtype(dt), buffer=shm.buf, offset=off)
+            for key, (off, dt, shape) in layout.items()}
+
+def _live(refs, views):
+    """refs without the dead ones, plus weak references to `views`.
+    Every slice/reshape of a view keeps that view alive (its .base)."""
+    return [r for r in refs if r() is not None] + [weakref.ref(v) for v in views.values()]
+
+
+# blocks closed by their users but still mapped for live views
+_retired = []
+_retired_lock = threading.Lock()
+
+def _retire(shm, refs):
+    """Close shm as soon as none of the views behind refs is alive."""
+    with _retired_lock:
+        _retired.append((shm, refs))
+        _sweep()
+
+def _sweep():
+    # caller holds _retired_lock
+    keep = []
+    for shm, refs in _retired:
+        if any(r() is not None for r in refs):
+            keep.append((shm, refs))
+        else:
+            shm.close()
+    _retired[:] = keep
+
+
+# worker side: blocks attached by name. The most recent few are kept open;
+# pinned ones (backing a cached bank) stay until release()d.
+_attached = OrderedDict()   # name -> [SharedMemory, view refs, pinned]
+_attached_lock = threading.Lock()
+KEEP_ATTACHED = 4
+
+def attach(spec, pin=False):
+    """name -> read-only views of a block created by SharedArrays"""
+    name, layout = spec
+    with _retired_lock:
+        _sweep()
+    with _attached_lock:
+        entry = _attached.get(name)
+        if entry is None:
+            # pool workers share the owner's resource tracker, so this
+            # registration is the owner's and goes away with its unlink()
+            entry = _attached[name] = [shared_memory.SharedMemory(name=name), [], False]
+        _attached.move_to_end(name)
+        entry[2] = entry[2] or pin
+        views = _views(entry[0], layout)
+        entry[1] = _live(entry[1], views)
+        unpinned = [n for n, e in _attached.items() if not e[2]]
+        for old in unpinned[:max(0, len(unpinned) - KEEP_ATTACHED)]:
+            shm, refs, _ = _attached.pop(old)
+            _retire(shm, refs)
+    for v in views.values():
+        v.flags.writeable = False
+    return views
+
+def release(name):
+    """Unpin a block attach()ed with pin=True; it closes once unused."""
+    with _attached_lock:
+        entry = _attached.pop(name, None)
+        if entry is not None:
+            _retire(entry[0], entry[1])
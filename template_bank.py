@@ -0,0 +1,671 @@
+# template_bank.py
+import os
+import csv
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+ALL_CHARS_DIR = "all_chars"
+LABEL_FILE    = "char_labels.csv"
+BANK_FILE     = "template_bank.npz"
+BANK_VERSION  = 4
+STACK_CACHE_SIZE = 32   # glyph sizes kept as pre-resized template stacks
+
+# "resize": every template resized to each live glyph (original behavior)
+# "canonical": glyph and templates both stretched to one fixed box,
+#              aspect ratio scored separately
+# "bits":      canonical box, bit-packed, scored with popcounts
+MATCH_MODE       = "resize"
+CANONICAL_SIZE   = 32
+ASPECT_PENALTY_W = 0.5
+BITS_SIMILARITY  = "jaccard"   # or "hamming"
+
+# Candidate pruning: only the PRUNE_K templates nearest in descriptor
+# space get the full score. 0 → score the whole bank.
+PRUNE_K        = 64
+PROFILE_BINS   = 8
+
+# >0 → match against this many medoids per label instead of every sample
+MEDOIDS_PER_LABEL = 0
+
+
+def binarize_template(img):
+    """Otsu-threshold a grayscale glyph and make the strokes the 255 side."""
+    _, bin_img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.mean(bin_img) > 127:
+        bin_img = 255 - bin_img
+    return bin_img
+
+def count_holes(bin_img):
+    cnts, hier = cv2.findContours(
+        bin_img, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
+    )
+    if hier is None:
+        return 0
+    hole_count = 0
+    for h in hier[0]:
+        # h[3] != -1 → this contour has a parent → it's a hole
+        if h[3] != -1:
+            hole_count += 1
+    return hole_count
+
+def count_blobs(bin_img):
+    # bin_img: single-channel, 0/255, foreground=255
+    cnts, _ = cv2.findContours(bin_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return len(cnts)
+
+def canonicalize(bin_img, size=CANONICAL_SIZE):
+    """
+    Stretch a 0/255 glyph into the size×size box → flat 0/1 uint8 vector.
+    Fixed threshold rather than Otsu+invert: a stretched "1" can end up
+    mostly ink, which the mean>127 inversion would flip.
+    """
+    rs = cv2.resize(bin_img, (size, size), interpolation=cv2.INTER_AREA)
+    return (rs.ravel() >= 128).astype(np.uint8)
+
+def log_aspect(bin_img):
+    h, w = bin_img.shape[:2]
+    return float(np.log(w / h))
+
+def pack_bits(canon):
+    """(..., P) 0/1 → (..., ceil(P/64)) uint64, zero-padded at the end"""
+    packed = np.packbits(canon, axis=-1)
+    pad = -packed.shape[-1] % 8
+    if pad:
+        widths = [(0, 0)] * (packed.ndim - 1) + [(0, pad)]
+        packed = np.pad(packed, widths)
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def unpack_bits(bits, n_bits):
+    return np.unpackbits(bits.view(np.uint8), axis=-1, count=n_bits)
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        """set bits per row of a (..., W) uint64 array"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    def popcount(words):
+        """set bits per row of a (..., W) uint64 array"""
+        return _POP8[words.view(np.uint8)].sum(axis=-1, dtype=np.int32)
+
+
+def glyph_features(bin_img, holes=None):
+    """
+    Cheap descriptor for the candidate index:
+      holes, blobs, log aspect, ink density,
+      PROFILE_BINS row + PROFILE_BINS column ink profiles (canonical box)
+    """
+    if holes is None:
+        holes = count_holes(bin_img)
+    canon = canonicalize(bin_img).reshape(CANONICAL_SIZE, CANONICAL_SIZE)
+    band = CANONICAL_SIZE // PROFILE_BINS
+    rows = canon.reshape(PROFILE_BINS, band, CANONICAL_SIZE).mean(axis=(1, 2))
+    cols = canon.reshape(CANONICAL_SIZE, PROFILE_BINS, band).mean(axis=(0, 2))
+    head = [holes, 0.25 * count_blobs(bin_img), 2.0 * log_aspect(bin_img),
+            2.0 * canon.mean()]
+    return np.concatenate([head, rows, cols]).astype(np.float32)
+
+
+class FeatureIndex:
+    """
+    k-nearest-neighbour lookup over template descriptors (KD-tree when
+    scipy is available, brute force otherwise). Counts how much of the
+    bank the queries let the matcher skip.
+    """
+    def __init__(self, features):
+        self.features = features
+        self.size = len(features)
+        self.tree = cKDTree(features) if cKDTree is not None and self.size else None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.queries = 0
+        self.scored = 0
+
+    def query(self, feat, k):
+        """sorted indices of the k templates nearest to feat"""
+        k = min(k, self.size)
+        if self.tree is not None:
+            _, idx = self.tree.query(feat, k)
+        else:
+            d = ((self.features - feat) ** 2).sum(axis=1)
+            idx = np.argpartition(d, k - 1)[:k]
+        idx = np.sort(np.atleast_1d(idx))
+        with self._stats_lock:
+            self.queries += 1
+            self.scored += len(idx)
+        return idx
+
+    def pruning_ratio(self):
+        if not self.queries:
+            return 0.0
+        return 1.0 - self.scored / (self.queries * self.size)
+
+    def report(self):
+        if not self.queries:
+            return "Template index: no pruned lookups yet"
+        return (f"Template index: {self.queries} glyphs, "
+                f"{self.scored / self.queries:.0f}/{self.size} templates scored each "
+                f"({self.pruning_ratio():.1%} pruned)")
+
+
+class TemplateStack:
+    """
+    Every template resized + re-binarized to one glyph size (h, w),
+    flattened into a contiguous (N, h*w) float32 matrix of 0/1 pixels.
+    """
+    def __init__(self, fg, norm, holes):
+        self.fg = fg          # (N, P) float32, 1 where template is foreground
+        self.norm = norm      # (N,) L2 norm of each zero-mean template row
+        self.holes = holes    # (N,) hole count at this size
+
+
+class TemplateBank:
+    """
+    All labeled glyphs, pre-binarized, in file order.
+      labels[k] / images[k] / holes[k] describe template k.
+    images are 0/255 uint8 views into one flat pixel buffer.
+    """
+    def __init__(self, labels, images, holes, fingerprint="", canon_bits=None,
+                 aspect=None, features=None):
+        self.labels = list(labels)
+        self.images = list(images)
+        self.holes = np.asarray(holes, dtype=np.int32)
+        self.fingerprint = fingerprint
+        self._stacks = OrderedDict()   # (h, w) -> TemplateStack, LRU
+        self._stacks_lock = threading.Lock()   # banks are shared by worker threads
+
+        # canonical-mode templates, normally read from the pack file.
+        # Kept bit-packed: CANONICAL_SIZE**2 bits per template.
+        if canon_bits is None:
+            canon = np.array([canonicalize(img) for img in self.images],
+                             dtype=np.uint8).reshape(len(self.images), CANONICAL_SIZE**2)
+            canon_bits = pack_bits(canon)
+        if aspect is None:
+            aspect = [log_aspect(img) for img in self.images]
+        self.canon_bits = np.ascontiguousarray(canon_bits, dtype=np.uint64)
+        self.canon_ones = popcount(self.canon_bits)
+        self.aspect = np.asarray(aspect, dtype=np.float32)
+        self._canon_stack = None
+
+        # candidate index over cheap descriptors
+        if features is None:
+            features = [glyph_features(img, h) for img, h in zip(self.images, self.holes)]
+        self.features = np.asarray(features, dtype=np.float32).reshape(
+            len(self.images), 4 + 2 * PROFILE_BINS)
+        self.index = FeatureIndex(self.features)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def stack_at(self, h, w):
+        """
+        Templates at glyph size (h, w). The resize/Otsu/hole work is done
+        once per size; the font is fixed, so sizes repeat constantly.
+        """
+        key = (h, w)
+        with self._stacks_lock:
+            stack = self._stacks.get(key)
+            if stack is not None:
+                self._stacks.move_to_end(key)
+                return stack
+
+        n, p = len(self.images), h * w
+        fg = np.empty((n, p), dtype=np.float32)
+        holes = np.empty(n, dtype=np.int32)
+        for k, tmpl in enumerate(self.images):
+            tmpl_rs = cv2.resize(tmpl, (w, h), interpolation=cv2.INTER_AREA)
+            tmpl_bin = binarize_template(tmpl_rs)
+            fg[k] = (tmpl_bin.ravel() == 255)
+            holes[k] = count_holes(tmpl_bin)
+        centered = fg - fg.mean(axis=1, keepdims=True)
+        norm = np.sqrt(np.einsum("ij,ij->i", centered, centered))
+        stack = TemplateStack(fg, norm, holes)
+
+        # two threads may build the same size at once; both results are equal
+        with self._stacks_lock:
+            self._stacks[key] = stack
+            if len(self._stacks) > STACK_CACHE_SIZE:
+                self._stacks.popitem(last=False)
+        return stack
+
+    def canonical_stack(self):
+        """Canonical-mode templates; native-size hole counts."""
+        if self._canon_stack is None:
+            fg = unpack_bits(self.canon_bits, CANONICAL_SIZE**2).astype(np.float32)
+            centered = fg - fg.mean(axis=1, keepdims=True)
+            norm = np.sqrt(np.einsum("ij,ij->i", centered, centered))
+            self._canon_stack = TemplateStack(fg, norm, self.holes)
+        return self._canon_stack
+
+    def subset(self, idx, tag=""):
+        """New bank holding templates idx, sharing the precomputed arrays."""
+        idx = np.asarray(idx, dtype=np.int64)
+        return TemplateBank([self.labels[k] for k in idx],
+                            [self.images[k] for k in idx],
+                            self.holes[idx],
+                            self.fingerprint + tag,
+                            self.canon_bits[idx],
+                            self.aspect[idx],
+                            self.features[idx])
+
+    def by_label(self):
+        """label -> list of images (the old load_templates() layout)"""
+        out = {}
+        for label, img in zip(self.labels, self.images):
+            out.setdefault(label, []).append(img)
+        return out
+
+
+def _read_label_rows(label_file):
+    rows = []
+    with open(label_file) as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            rows.append((row[0], row[1].strip()))
+    return rows
+
+def bank_fingerprint(label_file=LABEL_FILE, chars_dir=ALL_CHARS_DIR):
+    """
+    Hash of char_labels.csv plus the mtime/size of every labeled image.
+    Only stats the PNGs, so it is cheap enough to check on every scan.
+    """
+    h = hashlib.sha1(f"v{BANK_VERSION}".encode())
+    if not os.path.exists(label_file):
+        return h.hexdigest()
+    with open(label_file, "rb") as f:
+        h.update(f.read())
+    for fname, _ in _read_label_rows(label_file):
+        try:
+            st = os.stat(os.path.join(chars_dir, fname))
+        except OSError:
+            h.update(f"{fname}:missing\n".encode())
+            continue
+        h.update(f"{fname}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return h.hexdigest()
+
+def build_template_bank(label_file=LABEL_FILE, chars_dir=ALL_CHARS_DIR, fingerprint=None):
+    """Read + Otsu every labeled PNG. This is the slow path the pack file avoids."""
+    if fingerprint is None:
+        fingerprint = bank_fingerprint(label_file, chars_dir)
+    labels, images, holes = [], [], []
+    if os.path.exists(label_file):
+        for fname, label in _read_label_rows(label_file):
+            img_path = os.path.join(chars_dir, fname)
+            if not os.path.exists(img_path):
+                continue
+            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                continue
+            img = binarize_template(img)
+            labels.append(label)
+            images.append(img)
+            holes.append(count_holes(img))
+    return TemplateBank(labels, images, holes, fingerprint)
+
+def bank_arrays(bank):
+    """The bank as flat arrays (pack file / shared memory layout)."""
+    shapes = np.array([img.shape for img in bank.images], dtype=np.int32).reshape(-1, 2)
+    sizes = shapes[:, 0].astype(np.int64) * shapes[:, 1]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    pixels = (np.concatenate([img.ravel() for img in bank.images])
+              if bank.images else np.zeros(0, np.uint8))
+    return {"labels": np.array(bank.labels, dtype=str),
+            "shapes": shapes,
+            "offsets": offsets,
+            "pixels": pixels,
+            "holes": bank.holes,
+            "canon_bits": bank.canon_bits,
+            "aspect": bank.aspect,
+            "features": bank.features}
+
+def bank_from_arrays(arrays, fingerprint, cls=None):
+    """Inverse of bank_arrays; images stay views into arrays["pixels"]."""
+    shapes, offsets, pixels = arrays["shapes"], arrays["offsets"], arrays["pixels"]
+    labels = [str(l) for l in arrays["labels"]]
+    images = [pixels[offsets[k]:offsets[k+1]].reshape(shapes[k])
+              for k in range(len(labels))]
+    return (cls or TemplateBank)(labels, images, arrays["holes"], fingerprint,
+                                 arrays["canon_bits"], arrays["aspect"],
+                                 arrays["features"])
+
+def save_template_bank(bank, path=BANK_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f,
+                 version=np.int32(BANK_VERSION),
+                 fingerprint=np.array(bank.fingerprint),
+                 **bank_arrays(bank))
+    os.replace(tmp, path)
+
+def load_template_bank(path=BANK_FILE):
+    """Returns the packed bank, or None if the file is missing/unreadable."""
+    try:
+        with np.load(path) as pack:
+            if int(pack["version"]) != BANK_VERSION:
+                return None
+            fingerprint = str(pack["fingerprint"])
+            arrays = {key: pack[key] for key in pack.files
+                      if key not in ("version", "fingerprint")}
+    except Exception:
+        return None
+    return bank_from_arrays(arrays, fingerprint)
+
+
+class SharedTemplateBank(TemplateBank):
+    """
+    A bank whose arrays live in shared memory. Pickles as the block's
+    name, so handing it to a pool worker costs a few bytes and the worker
+    attaches to the same pixels (see attach_template_bank).
+    """
+    spec = None
+
+    def __reduce__(self):
+        return attach_template_bank, (self.spec, self.fingerprint)
+
+def share_template_bank(bank):
+    """(SharedArrays owner, SharedTemplateBank view of it) for bank."""
+    from shared_arrays import SharedArrays
+    owner = SharedArrays(bank_arrays(bank))
+    shared = bank_from_arrays(owner.arrays, bank.fingerprint, SharedTemplateBank)
+    shared.spec = owner.spec
+    return owner, shared
+
+_attached_banks = OrderedDict()    # worker side: block name -> bank
+
+def attach_template_bank(spec, fingerprint):
+    """
+    Worker side of SharedTemplateBank pickling. The bank (and so its
+    per-size stacks) is built once per block and reused by later tasks.
+    """
+    from shared_arrays import attach, release
+    name = spec[0]
+    with _bank_lock:
+        bank = _attached_banks.get(name)
+        if bank is None:
+            # pinned: scan buffers coming and going must not evict it
+            bank = bank_from_arrays(attach(spec, pin=True), fingerprint,
+                                    SharedTemplateBank)
+            bank.spec = spec
+            _attached_banks[name] = bank
+            while len(_attached_banks) > 2:
+                old, _ = _attached_banks.popitem(last=False)
+                release(old)
+        _attached_banks.move_to_end(name)
+        return bank
+
+
+def _score_stack(g, stack, holes_char, fill_penalty_w, hole_penalty_w, idx=None):
+    """g: flat 0/1 float32 glyph at the stack's size → (N,) or (len(idx),) scores"""
+    fg, t_norm, t_holes = stack.fg, stack.norm, stack.holes
+    if idx is not None:
+        fg, t_norm, t_holes = fg[idx], t_norm[idx], t_holes[idx]
+
+    gc = g - g.mean()
+    g_norm = float(np.sqrt(gc @ gc))
+
+    # one matmul gives both the correlation numerator and the fg overlap
+    prod = fg @ np.stack([gc, g], axis=1)
+    num, overlap = prod[:, 0], prod[:, 1]
+
+    # mirror cv2.matchTemplate: flat template → 1, flat glyph → 0
+    denom = t_norm * g_norm
+    ncc = np.divide(num, denom, out=np.zeros_like(num), where=denom > 1e-6)
+    ncc[t_norm <= 1e-6] = 1.0
+    ncc = np.clip(ncc, -1.0, 1.0)
+
+    fill_penalty = fill_penalty_w * (g.sum() - overlap) / g.size
+
+    hole_penalty = (hole_penalty_w * np.abs(holes_char - t_holes)
+                    / np.maximum(t_holes, 1))
+
+    return ncc - fill_penalty - hole_penalty
+
+def _score_bits(char_bin, bank, holes_char, fill_penalty_w, hole_penalty_w,
+                aspect_penalty_w, similarity=None, idx=None):
+    """
+    Popcount scoring against the packed canonical bank. With I = |G & T|:
+      jaccard = I / (|G| + |T| - I),  hamming = 1 - (|G| + |T| - 2I) / P
+      fill    = (|G| - I) / P        (live fg where template is bg)
+    so one AND + popcount over the bank is all the per-template work.
+    """
+    similarity = similarity or BITS_SIMILARITY
+    n_bits = CANONICAL_SIZE**2
+    t_bits, ones_t = bank.canon_bits, bank.canon_ones
+    t_holes, t_aspect = bank.holes, bank.aspect
+    if idx is not None:
+        t_bits, ones_t = t_bits[idx], ones_t[idx]
+        t_holes, t_aspect = t_holes[idx], t_aspect[idx]
+
+    g_bits = pack_bits(canonicalize(char_bin))
+    inter = popcount(t_bits & g_bits)
+    ones_g = int(popcount(g_bits))
+
+    if similarity == "hamming":
+        sim = 1.0 - (ones_g + ones_t - 2 * inter) / n_bits
+    else:
+        union = ones_g + ones_t - inter
+        sim = np.divide(inter, union, out=np.ones(len(union)), where=union > 0)
+
+    fill_penalty = fill_penalty_w * (ones_g - inter) / n_bits
+    hole_penalty = (hole_penalty_w * np.abs(holes_char - t_holes)
+                    / np.maximum(t_holes, 1))
+    aspect_penalty = aspect_penalty_w * np.abs(log_aspect(char_bin) - t_aspect)
+    return sim - fill_penalty - hole_penalty - aspect_penalty
+
+def score_templates(char_bin, bank, fill_penalty_w=0.5, hole_penalty_w=0.7,
+                    mode=None, aspect_penalty_w=ASPECT_PENALTY_W,
+                    idx=None, holes_char=None):
+    """
+    Score of char_bin against every template in the bank, as one (N,) array.
+    Same formula as the old per-template loop:
+      TM_CCOEFF_NORMED - fill_penalty_w*(live fg where tmpl bg)/area
+                       - hole_penalty_w*|hole diff|/max(tmpl holes, 1)
+    In canonical mode the comparison happens in the fixed box and
+    aspect_penalty_w*|log aspect diff| is subtracted as well; bits mode
+    swaps the correlation for a popcount similarity (see _score_bits).
+    idx restricts scoring to those template indices.
+    """
+    mode = mode or MATCH_MODE
+    if holes_char is None:
+        holes_char = count_holes(char_bin)
+
+    if mode == "bits":
+        return _score_bits(char_bin, bank, holes_char, fill_penalty_w,
+                           hole_penalty_w, aspect_penalty_w, idx=idx)
+
+    if mode == "canonical":
+        g = canonicalize(char_bin).astype(np.float32)
+        scores = _score_stack(g, bank.canonical_stack(), holes_char,
+                              fill_penalty_w, hole_penalty_w, idx)
+        t_aspect = bank.aspect if idx is None else bank.aspect[idx]
+        return scores - aspect_penalty_w * np.abs(log_aspect(char_bin) - t_aspect)
+
+    h, w = char_bin.shape[:2]
+    g = (char_bin.ravel() == 255).astype(np.float32)
+    return _score_stack(g, bank.stack_at(h, w), holes_char,
+                        fill_penalty_w, hole_penalty_w, idx)
+
+def match_template_ncc_improved(
+    char_bin,
+    templates,  # TemplateBank
+    ncc_thresh=0.65,
+    fill_penalty_w=0.5,
+    hole_penalty_w=0.7,
+    mode=None,          # "resize" / "canonical" / "bits", default MATCH_MODE
+    prune_k=None        # candidates from the feature index, default PRUNE_K
+):
+    """
+    Returns (best_label, best_score) or (None, score) if below ncc_thresh.
+    Penalizes:
+      - Non-negative fills: live=fg where tmpl=bg
+      - Hole-count mismatches
+      - (canonical mode) aspect-ratio mismatch
+    Templates are first narrowed to the prune_k nearest in the feature
+    index, then scored in one batch.
+    """
+    if not templates:
+        return None, None
+
+    # blob_count = count_blobs(char_bin)
+    # if blob_count == 2:
+    #     return "!", 1.0
+    # elif blob_count == 3:
+    #     return "%", 1.0
+
+    holes_char = count_holes(char_bin)
+    prune_k = PRUNE_K if prune_k is None else prune_k
+    idx = None
+    if prune_k and prune_k < len(templates):
+        idx = templates.index.query(glyph_features(char_bin, holes_char), prune_k)
+
+    scores = score_templates(char_bin, templates, fill_penalty_w, hole_penalty_w,
+                             mode, idx=idx, holes_char=holes_char)
+    best = int(np.argmax(scores))
+    best_score = float(scores[best])
+    if idx is not None:
+        best = int(idx[best])
+    if best_score < ncc_thresh:
+        return None, best_score
+    return templates.labels[best], best_score
+
+
+def label_medoids(bank, k, iters=20, seed=0):
+    """
+    Indices of up to k representative templates per label (k-medoids).
+    Distance is canonical-box Hamming plus the aspect penalty in the same
+    bit units, i.e. roughly what the bits matcher would charge.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.array(bank.labels)
+    aspect_w = ASPECT_PENALTY_W * CANONICAL_SIZE**2
+    keep = []
+    for label in sorted(set(bank.labels)):
+        members = np.flatnonzero(labels == label)
+        if len(members) <= k:
+            keep.extend(members)
+            continue
+        bits = bank.canon_bits[members]
+        asp = bank.aspect[members]
+        d = popcount(bits[:, None, :] ^ bits[None, :, :]).astype(np.float32)
+        d += aspect_w * np.abs(asp[:, None] - asp[None, :])
+
+        # k-medoids++ seeding, then alternate assign / re-center
+        centers = [int(np.argmin(d.sum(axis=1)))]
+        while len(centers) < k:
+            dist = d[:, centers].min(axis=1)
+            if dist.sum() == 0:
+                break
+            centers.append(int(rng.choice(len(members), p=dist / dist.sum())))
+        for _ in range(iters):
+            assign = np.argmin(d[:, centers], axis=1)
+            new = []
+            for c in range(len(centers)):
+                m = np.flatnonzero(assign == c)
+                if len(m) == 0:
+                    new.append(centers[c])
+                else:
+                    new.append(int(m[np.argmin(d[np.ix_(m, m)].sum(axis=1))]))
+            if new == centers:
+                break
+            centers = new
+        keep.extend(members[sorted(set(centers))])
+    return np.sort(np.array(keep, dtype=np.int64))
+
+def compress_bank(bank, k):
+    """The bank reduced to k medoids per label."""
+    return bank.subset(label_medoids(bank, k), f":medoids{k}")
+
+
+_bank = None
+_bank_stamp = None  # _quick_stamp() when _bank was last checked
+_compressed = {}   # medoids per label -> compressed bank for _bank
+_bank_lock = threading.Lock()
+
+def get_template_bank(label_file=LABEL_FILE, chars_dir=ALL_CHARS_DIR, path=BANK_FILE,
+                      medoids=None):
+    """
+    Process-wide bank. With medoids (default MEDOIDS_PER_LABEL) > 0 the
+    medoid-compressed bank is returned instead; it is derived once per
+    full bank.
+    """
+    medoids = MEDOIDS_PER_LABEL if medoids is None else medoids
+    with _bank_lock:
+        bank = _load_bank(label_file, chars_dir, path)
+        if not medoids:
+            return bank
+        if medoids not in _compressed:
+            t0 = time.perf_counter()
+            _compressed[medoids] = compress_bank(bank, medoids)
+            print(f"Template bank: {len(_compressed[medoids])} medoids "
+                  f"({medoids}/label) in {(time.perf_counter()-t0)*1000:.1f} ms")
+        return _compressed[medoids]
+
+def _quick_stamp(label_file, chars_dir):
+    """
+    mtime/size of char_labels.csv and the mtime of all_chars/: two stats
+    instead of bank_fingerprint's hash and one stat per PNG. Relabeling,
+    adding or deleting glyphs changes it; a PNG rewritten in place under
+    the same name does not, that needs a relabel or restart to show up.
+    """
+    out = []
+    for p in (label_file, chars_dir):
+        try:
+            st = os.stat(p)
+            out.append((st.st_mtime_ns, st.st_size if p == label_file else 0))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+def _load_bank(label_file, chars_dir, path):
+    """
+    Full bank, order of preference:
+      1) the in-memory bank, if the fingerprint still matches
+      2) the pack file on disk, if its fingerprint matches
+      3) rebuild from all_chars/ and rewrite the pack file
+    """
+    global _bank, _bank_stamp
+    stamp = _quick_stamp(label_file, chars_dir)
+    if _bank is not None and stamp == _bank_stamp:
+        return _bank
+    fp = bank_fingerprint(label_file, chars_dir)
+    _bank_stamp = stamp
+    if _bank is not None and _bank.fingerprint == fp:
+        return _bank
+
+    t0 = time.perf_counter()
+    bank = load_template_bank(path)
+    if bank is not None and bank.fingerprint == fp:
+        print(f"Template bank: loaded {len(bank)} templates from {path} "
+              f"in {(time.perf_counter()-t0)*1000:.1f} ms")
+    else:
+        bank = build_template_bank(label_file, chars_dir, fp)
+        try:
+            save_template_bank(bank, path)
+        except Exception as e:
+            print(f"Could not write template bank: {e}")
+        print(f"Template bank: rebuilt {len(bank)} templates "
+              f"in {(time.perf_counter()-t0)*1000:.1f} ms")
+    _bank = bank
+    _compressed.clear()
+    return _bank
+
+
+if __name__ == "__main__":
+    # Force a rebuild of the pack file, e.g. after labeling new chars
+    t0 = time.perf_counter()
+    bank = build_template_bank()
+    save_template_bank(bank)
+    print(f"Wrote {len(bank)} templates to {BANK_FILE} "
+          f"in {(time.perf_counter()-t0)*1000:.1f} ms")
@@ -0,0 +1,123 @@
+# tile_detect.py
+# Finds the 25 grid tiles in a screenshot and cuts the grid into cells.
+# detect_tiles() looks for them on a subsampled copy and only goes back
+# to full resolution in a small window around each candidate;
+# detect_tiles_full() is the original whole-image pass, kept as the
+# reference (benchmark.py tiles). warp_grid() turns the tiles into the
+# 25 perspective-corrected cell crops the recognizer reads.
+import numpy as np
+import cv2
+from color_mask import color_classifier, to_bgr
+
+TILE_BGR = (244, 168, 103)
+TILE_TOL = 30                # max Euclidean BGR distance to TILE_BGR
+MIN_TILE_AREA = 2000         # full-resolution contour area
+COARSE_STEP = 4              # coarse pass looks at every 4th pixel
+GRID_BUFFER = 6              # px of margin around the warped 5x5 grid
+
+
+TILE_COLORS = {"tile": (TILE_BGR, TILE_TOL)}
+
+def tile_mask(img):
+    """255 where img is within TILE_TOL of TILE_BGR (color_mask.py)"""
+    return color_classifier(TILE_COLORS).mask(img)
+
+def _tile_candidates(mask, dx=0, dy=0):
+    """
+    The original contour filter: big, four-cornered, roughly square.
+    Returns [(area, x, y, w, h, approx), ...] offset by (dx, dy).
+    """
+    cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cands = []
+    for cnt in cnts:
+        area = cv2.contourArea(cnt)
+        if area < MIN_TILE_AREA:
+            continue
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02*peri, True)
+        if len(approx) != 4:
+            continue
+        x, y, ww, hh = cv2.boundingRect(approx)
+        ar = ww/float(hh) if hh > 0 else 0
+        if not 0.7 < ar < 1.3:
+            continue
+        cands.append((area, x+dx, y+dy, ww, hh, approx + (dx, dy)))
+    return cands
+
+def detect_tiles_full(img):
+    """
+    Whole-image detector (the pre-tile_detect code path).
+    Returns (candidates sorted by area, largest first, full-res mask).
+    """
+    tile_bgr = np.array(TILE_BGR, dtype=np.int16)
+    diff = np.linalg.norm(img.astype(np.int16) - tile_bgr[None, None, :], axis=2)
+    mask = (diff < TILE_TOL).astype(np.uint8) * 255
+    cands = _tile_candidates(mask)
+    cands.sort(key=lambda t: t[0], reverse=True)
+    return cands, mask
+
+def detect_tiles(img, step=COARSE_STEP):
+    """
+    Coarse-to-fine detector with the same output as detect_tiles_full:
+    1) tile mask on img[::step, ::step] (a view, exact pixel colors)
+    2) loose blob filter there (size only)
+    3) each blob's box, grown by a step or two, masked at full resolution
+       and put through the original contour filter
+    Returns (candidates sorted by area, largest first, coarse mask).
+    """
+    coarse = tile_mask(img[::step, ::step])
+    n, _, stats, _ = cv2.connectedComponentsWithStats(coarse, connectivity=8)
+    h, w = img.shape[:2]
+    pad = 2 * step
+    cands = {}
+    for i in range(1, n):
+        x, y, ww, hh, area = stats[i]
+        # half the full-res minimum: subsampling shaves the edges. No
+        # shape test here, merged neighbours (below) are not square.
+        if area * step * step < MIN_TILE_AREA / 2:
+            continue
+        x0, y0 = max(0, x*step - pad), max(0, y*step - pad)
+        x1, y1 = min(w, (x+ww)*step + pad), min(h, (y+hh)*step + pad)
+        # tiles closer than `step` merge into one blob, so keep all that
+        # pass; windows can overlap, so the same tile may come back twice
+        for c in _tile_candidates(tile_mask(img[y0:y1, x0:x1]), x0, y0):
+            cands[c[1:5]] = c
+    cands = sorted(cands.values(), key=lambda t: t[0], reverse=True)
+    return cands, coarse
+
+
+def sort_grid(tiles):
+    """25 tile candidates → 5 rows of 5 (x, y, w, h), top-left first"""
+    ent = sorted(((x + ww/2, y + hh/2, (x, y, ww, hh))
+                  for _, x, y, ww, hh, _ in tiles[:25]), key=lambda e: e[1])
+    return [[e[2] for e in sorted(ent[i*5:(i+1)*5])] for i in range(5)]
+
+def warp_grid(img, tiles, buffer=GRID_BUFFER):
+    """
+    Perspective-corrected grid from 25 tile candidates:
+    1) sort into 5x5 and take the outer corners of the corner tiles
+    2) warp them to 5 mean-sized cells plus `buffer` px on every side
+    3) cut out the cells
+    Returns (warped BGR, 25 cell views in row-major order, corners in img).
+    """
+    rows = sort_grid(tiles)
+    (x0, y0, _, _), (x1, y1, w1, _) = rows[0][0], rows[0][4]
+    (x2, y2, w2, h2), (x3, y3, _, h3) = rows[4][4], rows[4][0]
+    pts_src = np.array([(x0, y0), (x1 + w1, y1), (x2 + w2, y2 + h2), (x3, y3 + h3)],
+                       np.float32)
+
+    cell_w = int(np.mean([b[2] for row in rows for b in row]))
+    cell_h = int(np.mean([b[3] for row in rows for b in row]))
+    warp_w, warp_h = cell_w*5 + 2*buffer, cell_h*5 + 2*buffer
+    pts_dst = np.array([[buffer, buffer],
+                        [warp_w-buffer-1, buffer],
+                        [warp_w-buffer-1, warp_h-buffer-1],
+                        [buffer, warp_h-buffer-1]], np.float32)
+
+    M = cv2.getPerspectiveTransform(pts_src, pts_dst)
+    # warps a BGRA capture as is; only the small result is converted
+    warped = to_bgr(cv2.warpPerspective(img, M, (warp_w, warp_h)))
+    cells = [warped[buffer + i*cell_h : buffer + (i+1)*cell_h,
+                    buffer + j*cell_w : buffer + (j+1)*cell_w]
+             for i in range(5) for j in range(5)]
+    return warped, cells, pts_src